@@ -0,0 +1,181 @@
+"""
+Waymark benchmark suite.
+
+Generates synthetic worlds in the current JSON schema and times the hot paths of
+WaymarkApp (load, save, search, render) against a headless stand-in for
+ft.Page, so it runs on any machine without a display:
+
+    python bench_waymark.py
+    python bench_waymark.py --sizes 10 1000 --engines journal --json results.json
+"""
+import argparse
+import asyncio
+import atexit
+import base64
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Point the app at a throwaway data root *before* importing it: waymark_core resolves its paths at import time
+BENCH_ROOT = tempfile.mkdtemp(prefix="waymark_bench_")
+os.environ["APPDATA"] = BENCH_ROOT
+atexit.register(shutil.rmtree, BENCH_ROOT, ignore_errors=True)
+
+import waymark_core as core
+import waymark_v5 as wm
+
+DEFAULT_SIZES = [10, 1_000, 100_000]
+RENDER_SAMPLE = 1_000 # Cards built by the render benchmark, whatever the world size
+SEARCH_TERMS = ["a", "fa", "farm", "iron farm 1"]
+WORDS = ["iron", "farm", "village", "fortress", "base", "portal", "lush", "cave", "mending", "librarian",
+         "outpost", "monument", "stronghold", "spawner", "bastion", "shipwreck", "mansion", "temple"]
+# 1x1 transparent PNG used for the synthetic screenshots
+TINY_PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=")
+
+# --- HEADLESS PAGE ---
+class HeadlessPage:
+    """Just enough of ft.Page for WaymarkApp to run without a Flet client."""
+    def __init__(self):
+        self.overlay = []
+        self.controls = []
+        self.updates = 0
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def update(self, *controls):
+        self.updates += 1
+
+    def set_clipboard(self, value):
+        pass
+
+    def run_task(self, handler, *args, **kwargs):
+        return asyncio.run(handler(*args, **kwargs))
+
+def count_controls(controls):
+    """Counts every control in the given trees, the way Flet would walk them on update."""
+    total, stack = 0, list(controls)
+    while stack:
+        control = stack.pop()
+        total += 1
+        stack.extend(control._get_children())
+    return total
+
+# --- SYNTHETIC WORLDS ---
+def make_world(size, image_ratio=0.3, seed=0):
+    """Returns a world's JSON list: `size` waymarks with mixed dimensions and some screenshots."""
+    rnd = random.Random(seed)
+    core.ensure_storage_dirs()
+    image = os.path.join(core.IMAGE_DIR, "bench.png")
+    with open(image, "wb") as f: f.write(TINY_PNG)
+    data = []
+    for i in range(size):
+        record = core.Waymark(
+            f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}",
+            round(rnd.uniform(-20_000, 20_000), 2), rnd.randint(-64, 320), round(rnd.uniform(-20_000, 20_000), 2),
+            rnd.choice(list(core.Dimension)), image=image if rnd.random() < image_ratio else "")
+        data.append(record.to_dict())
+    data.append({"type": "world_meta", "seed": str(rnd.getrandbits(63))})
+    return data
+
+def install_world(engine, name, data):
+    """Writes the world file and opens an app on it with a clean store."""
+    for f in os.listdir(core.STORAGE_DIR):
+        path = os.path.join(core.STORAGE_DIR, f)
+        if os.path.isfile(path): os.remove(path)
+    with open(os.path.join(core.STORAGE_DIR, f"{name}.json"), "w") as f: json.dump(data, f, indent=4)
+    core.STORAGE_ENGINE = engine
+    return wm.WaymarkApp(HeadlessPage())
+
+# --- MEASUREMENT ---
+def measure(fn, repeat=1):
+    """Runs fn untraced for wall time, then once under tracemalloc for its peak allocation."""
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(repeat): fn()
+    wall = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall, peak
+
+def cold_load(app):
+    """Forgets every in-process cache so the world is read back from storage."""
+    if isinstance(app.store, core.JournalWorldStore): app.store.worlds.clear()
+    app.sync_registry_from_file()
+
+def add_entry(app):
+    app.ui_desc_in.value, app.ui_x_in.value, app.ui_y_in.value, app.ui_z_in.value = "bench add", "12.5", "64", "-40"
+    app.process_new_entry(None)
+
+def edit_entry(app):
+    app.show_edit_dialog(app.world.entries[0].id)
+    dlg = app.page.overlay.pop()
+    dlg.content.content.controls[0].value = f"bench edit {time.perf_counter()}"
+    dlg.actions[1].on_click(None)
+
+def delete_entry(app):
+    app.prompt_delete_entry(app.world.entries[0].id)
+    app.page.overlay.pop().actions[1].on_click(None)
+
+def search(app, term):
+    wm.SEARCH_DEBOUNCE = 0
+    app.ui_search.value = term
+    app.apply_search_filter(None)
+
+def render_cards(app):
+    for entry in app.world.entries[:RENDER_SAMPLE]: app.build_waymark_card(entry)
+
+def run_size(engine, size, repeat):
+    data = make_world(size)
+    app = install_world(engine, "Bench", data)
+    results = []
+
+    def record(op, fn, n=repeat):
+        wall, peak = measure(fn, n)
+        results.append({"engine": engine, "size": size, "op": op, "wall_ms": wall * 1000, "peak_kb": peak / 1024,
+                        "controls": count_controls(app.page.controls)})
+
+    record("load", lambda: cold_load(app), 1)
+    record("save:add", lambda: add_entry(app))
+    record("save:edit", lambda: edit_entry(app))
+    record("save:delete", lambda: delete_entry(app))
+    if isinstance(app.store, core.JournalWorldStore):
+        record("save:compact", lambda: app.store.compact("Bench"), 1)
+    for term in SEARCH_TERMS:
+        record(f"search:{term!r}", lambda: search(app, term))
+    search(app, "")
+    record(f"render:{min(size, RENDER_SAMPLE)} cards", lambda: render_cards(app), 1)
+    if isinstance(app.store, core.SqliteWorldStore): app.store.conn.close()
+    return results
+
+def print_table(results):
+    print(f"{'engine':<8} {'size':>8}  {'operation':<22} {'wall ms':>10} {'peak KiB':>10} {'controls':>9}")
+    for r in results:
+        print(f"{r['engine']:<8} {r['size']:>8}  {r['op']:<22} {r['wall_ms']:>10.2f} {r['peak_kb']:>10.1f} {r['controls']:>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Waymark load, save, search and render paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--engines", nargs="+", default=["sqlite", "journal"], choices=["sqlite", "journal"])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs averaged for the cheap operations")
+    parser.add_argument("--json", metavar="PATH", help="Also write the raw results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for engine in args.engines:
+        for size in args.sizes:
+            results.extend(run_size(engine, size, args.repeat))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
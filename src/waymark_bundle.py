@@ -0,0 +1,223 @@
+"""
+Shareable world bundles: one zip holding a world's waymarks, their screenshots
+(each stored once, under its content hash) and thumbnails, with image paths
+relative to the bundle. Both directions stream, so neither the world nor the
+bundle is ever copied whole to memory or to a temporary file. Each bundle is a
+snapshot with its own ID, and lists the snapshots its world descends from; both
+ends keep the snapshots they've shared as the bases waymark_merge reconciles
+copies against.
+"""
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import zipfile
+import zlib
+
+import waymark_core as core
+from waymark_core import IMAGE_EXTENSIONS, ImageStore, Waymark, make_thumbnail, thumbnail_path
+
+BUNDLE_EXTENSION = ".waymark"
+BUNDLE_FORMAT = "waymark-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_BATCH = 1000 # Waymarks committed per write on import
+MANIFEST, WAYMARKS = "manifest.json", "waymarks.jsonl"
+BASES_SUFFIX = ".bases" # <world>.bases/<snapshot>.jsonl in STORAGE_DIR: the world as shared in each snapshot
+BASE_HISTORY = 8 # Snapshots kept per world; a copy that branched off an older one merges without a base
+SNAPSHOT_ID = re.compile(r"[0-9a-f]{32}") # Snapshot IDs come from other people's manifests and end up in file names
+WORLD_NAME_LENGTH = 64 # Longest world name a bundle can give the world it unpacks into
+
+# --- MERGE BASES ---
+# The waymarks as they were in each snapshot the world was bundled as, unbundled from or merged with. Every
+# one is an ancestor of the world; the newest one an incoming copy also descends from is what both last had in common.
+def base_dir(world):
+    return os.path.join(core.STORAGE_DIR, world + BASES_SUFFIX)
+
+def base_path(world, snapshot):
+    return os.path.join(base_dir(world), snapshot + ".jsonl")
+
+def snapshots(world):
+    """The IDs of the world's kept snapshots, newest first."""
+    try: ids = [n[:-len(".jsonl")] for n in os.listdir(base_dir(world)) if n.endswith(".jsonl")]
+    except OSError: return []
+    return sorted(filter(SNAPSHOT_ID.fullmatch, ids), key=lambda i: os.path.getmtime(base_path(world, i)), reverse=True)
+
+def lineage(manifest):
+    """The snapshot IDs a bundle's copy descends from, its own first; ones that aren't well-formed IDs are dropped."""
+    ancestors = manifest.get("ancestors")
+    ids = [manifest.get("snapshot"), *(ancestors if isinstance(ancestors, list) else [])]
+    return [i for i in ids if isinstance(i, str) and SNAPSHOT_ID.fullmatch(i)]
+
+def base_writer(world, snapshot):
+    """Opens a snapshot's base for writing; keep_base files it once it's complete."""
+    os.makedirs(base_dir(world), exist_ok=True)
+    return open(base_path(world, snapshot) + ".tmp", "w", encoding="utf-8")
+
+def keep_base(world, snapshot, keep=True):
+    """Files a base written through base_writer (or drops it, with keep=False), then prunes past BASE_HISTORY."""
+    tmp = base_path(world, snapshot) + ".tmp"
+    if not keep:
+        os.remove(tmp); return
+    os.replace(tmp, base_path(world, snapshot))
+    for old in snapshots(world)[BASE_HISTORY:]: os.remove(base_path(world, old))
+
+def load_base(world, snapshot):
+    """Returns a kept snapshot as {ID: record}."""
+    base = {}
+    with open(base_path(world, snapshot), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip(): entry = Waymark.from_dict(json.loads(line)); base[entry.id] = entry
+    return base
+
+def forget_base(world):
+    shutil.rmtree(base_dir(world), ignore_errors=True)
+
+# --- EXPORT ---
+def export_bundle(store, world, path):
+    """Writes `world` to a bundle at `path`, oldest waymark first, and keeps it as a snapshot. Returns how many waymarks it holds."""
+    images, store_images = {}, ImageStore(store) # Local image path -> name inside the bundle, so every screenshot is packed once
+    count, snapshot, ancestors = 0, core.new_entry_id(), snapshots(world)
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf, base_writer(world, snapshot) as base:
+        with zf.open(WAYMARKS, "w", force_zip64=True) as raw, io.TextIOWrapper(raw, encoding="utf-8") as f:
+            for entry in store.iter_entries(world):
+                data = entry.to_dict()
+                data["image"] = bundle_image(entry.image, images, store_images)
+                line = json.dumps(data, separators=(",", ":")) + "\n"
+                f.write(line); base.write(line)
+                count += 1
+        # Different local copies of the same bytes share one bundle name; only the first is packed
+        for name, source in {name: source for source, name in reversed(images.items())}.items():
+            # Screenshots are compressed already; deflating them again only costs time
+            zf.write(source, f"images/{name}", zipfile.ZIP_STORED)
+            thumb = thumbnail_path(source)
+            if os.path.exists(thumb): zf.write(thumb, f"thumbs/{os.path.splitext(name)[0]}.jpg", zipfile.ZIP_STORED)
+        manifest = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, "world": world,
+                    "seed": store.load_world(world, 0)[1], "entries": count, "snapshot": snapshot, "ancestors": ancestors}
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=4))
+    os.replace(tmp, path)
+    keep_base(world, snapshot)
+    return count
+
+def bundle_image(path, images, store_images):
+    """Returns the bundle-relative reference for a local screenshot ("" if it's gone), queuing it for packing."""
+    if not path or not os.path.isfile(path): return ""
+    if path not in images:
+        # Store images are already named by their hash; anything else is hashed so duplicates still collapse
+        name = store_images.key(path) or ImageStore.digest(path) + (os.path.splitext(path)[1].lower() or ".png")
+        images[path] = name
+    return f"images/{images[path]}"
+
+# --- IMPORT ---
+def read_manifest(path):
+    """Returns the bundle's manifest; raises ValueError for anything that isn't a bundle this version can read."""
+    try:
+        with zipfile.ZipFile(path) as zf: manifest = json.loads(zf.read(MANIFEST))
+    except (KeyError, ValueError, zipfile.BadZipFile):
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{os.path.basename(path)} is not a Waymark bundle")
+    if manifest.get("version", 0) > BUNDLE_VERSION:
+        raise ValueError(f"{os.path.basename(path)} was made by a newer Waymark")
+    return manifest
+
+def bundle_record(line, number, path):
+    """Parses one waymarks.jsonl line. Bundles come from other people, so anything that isn't a waymark raises ValueError."""
+    try:
+        data = json.loads(line)
+        if not isinstance(data, dict): raise TypeError
+        entry = Waymark.from_dict(data)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError(f"line {number} is not a waymark") from None
+    entry.id, entry.image = str(entry.id), str(entry.image)
+    return entry
+
+def safe_world_name(name):
+    """Reduces a name taken from a bundle to letters, digits, _ and -, since it becomes part of file names."""
+    return re.sub(r"[^\w-]", "_", str(name or "").strip())[:WORLD_NAME_LENGTH] or "Shared_World"
+
+def free_world_name(store, name):
+    """Returns `name`, or `name_2`, `name_3`... if a world by that name already exists."""
+    taken, candidate, n = set(store.list_worlds()), name, 1
+    while candidate in taken:
+        n += 1; candidate = f"{name}_{n}"
+    return candidate
+
+def import_bundle(store, path, images, world=None):
+    """
+    Unpacks a bundle into a new world (named after the bundled one unless `world` is given) and returns
+    (world name, waymarks imported). Each screenshot is streamed into the local image store the first
+    time a waymark refers to it, so references are rewritten in the same pass that reads the waymarks.
+    The bundle's snapshot becomes the new world's merge base, unless IDs had to be changed on the way in:
+    then its waymarks no longer match the copies they came from. A bundle that turns out to be broken
+    partway raises ValueError and leaves no world behind.
+    """
+    manifest = read_manifest(path)
+    name = free_world_name(store, safe_world_name(world or manifest.get("world")))
+    shared = lineage(manifest)[:1] == [manifest.get("snapshot")] # A bundle without a usable ID can never be matched as a base
+    snapshot = manifest["snapshot"] if shared else core.new_entry_id()
+    store.create_world(name)
+    if manifest.get("seed"): store.set_seed(name, str(manifest["seed"]))
+    stored = {} # Bundle reference -> local path ("" if the bundle doesn't have it)
+    batch, committed, seen, reassigned = [], [], set(), 0
+
+    def discard():
+        store.delete_world(name); forget_base(name)
+        images.release(*committed)
+    try:
+        with zipfile.ZipFile(path) as zf, io.TextIOWrapper(zf.open(WAYMARKS), encoding="utf-8") as f, \
+                base_writer(name, snapshot) as base:
+            members = set(zf.namelist())
+            for number, line in enumerate(f, 1):
+                if not line.strip(): continue
+                entry = bundle_record(line, number, path)
+                if entry.id in seen: # A hand-edited bundle can repeat IDs
+                    entry.id = core.new_entry_id(); reassigned += 1
+                seen.add(entry.id)
+                if entry.image not in stored: stored[entry.image] = unpack_image(zf, members, entry.image, images)
+                entry.image = stored[entry.image]
+                batch.append(entry)
+                if len(batch) >= BUNDLE_BATCH: reassigned += commit_batch(store, name, batch, images, base, committed)
+            reassigned += commit_batch(store, name, batch, images, base, committed)
+        keep_base(name, snapshot, keep=shared and not reassigned)
+    except (ValueError, KeyError, zipfile.BadZipFile, zlib.error) as e:
+        discard()
+        raise ValueError(f"{os.path.basename(path)} is damaged: {e}") from None
+    except (OSError, sqlite3.Error):
+        discard()
+        raise
+    return name, len(seen)
+
+def unpack_image(zf, members, reference, images):
+    """Copies one bundled screenshot (and its thumbnail) into the image store; returns its local path."""
+    name = os.path.basename(reference or "")
+    if not name.lower().endswith(IMAGE_EXTENSIONS) or f"images/{name}" not in members: return ""
+    with zf.open(f"images/{name}") as f: local = images.put_stream(f, os.path.splitext(name)[1].lower())
+    thumb, bundled = thumbnail_path(local), f"thumbs/{os.path.splitext(name)[0]}.jpg"
+    if not os.path.exists(thumb):
+        # The bundled thumbnail is only trusted if the image really is what its name says
+        if os.path.basename(local) == name and bundled in members:
+            with zf.open(bundled) as src, open(thumb + ".tmp", "wb") as out:
+                for chunk in iter(lambda: src.read(ImageStore.HASH_CHUNK), b""): out.write(chunk)
+            os.replace(thumb + ".tmp", thumb)
+        else:
+            make_thumbnail(local)
+    return local
+
+def commit_batch(store, world, batch, images, base, committed):
+    """
+    Writes a batch of imported waymarks, with fresh IDs for any the database already holds, and adds their
+    images to `committed` (the references to give back if the import fails later). Returns how many IDs it changed.
+    """
+    if not batch: return 0
+    taken = store.existing_ids(e.id for e in batch)
+    for entry in batch:
+        if entry.id in taken: entry.id = core.new_entry_id()
+    store.insert_entries(world, batch)
+    images.retain(*(e.image for e in batch))
+    committed += [e.image for e in batch]
+    base.writelines(json.dumps(e.to_dict(), separators=(",", ":")) + "\n" for e in batch)
+    batch.clear()
+    return len(taken)
@@ -0,0 +1,310 @@
+"""
+Waymark from the command line: list, add, bulk-import, query, export and
+compact worlds, and pack them into shareable bundles (or merge a friend's back), without a GUI session (and without importing Flet). Records are
+read from stdin and written to stdout one line at a time, oldest first, so
+`export` output can be piped straight back into `import`:
+
+    python waymark_cli.py list
+    python waymark_cli.py add My_World "Iron Farm" 120 64 -340 --dimension nether
+    python waymark_cli.py import My_World < waymarks.jsonl
+    python waymark_cli.py import My_World "XaeroWaypoints/My Server/dim%-1/mw$default_1.txt"
+    python waymark_cli.py query My_World --text farm --near 100 -300 --radius 500
+    python waymark_cli.py export My_World --format tsv > waymarks.tsv
+    python waymark_cli.py export My_World --format xaero --dimension nether -o "XaeroWaypoints/My Server"
+    python waymark_cli.py bundle My_World -o My_World.waymark
+    python waymark_cli.py unbundle Friends_World.waymark --world Friends_World
+    python waymark_cli.py merge My_World My_World_from_Sam.waymark --conflicts newer
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sqlite3
+import sys
+
+import waymark_core as core
+from waymark_core import Dimension, ImageStore, InvalidWaymark, Waymark, World, make_thumbnail, nearest_entries, waymark_filter
+from waymark_bundle import export_bundle, import_bundle
+from waymark_formats import FOLDER_FORMATS, READERS, WRITERS, export_waymarks, read_waypoint_file
+from waymark_merge import MergePlan, plan_merge
+
+IMPORT_BATCH = 1000 # Lines committed per write; bounds memory and keeps large imports to a few hundred transactions
+FORMATS = ("jsonl", "tsv")
+CONFLICT_RULES = {"mine": lambda conflict: False, "theirs": lambda conflict: True, "newer": MergePlan.newer}
+
+# --- LINE FORMATS ---
+# jsonl: one record per line in the world-file schema (world_meta lines set the seed)
+# tsv:   desc, x, y, z and optionally dimension, separated by tabs
+def parse_line(line, fmt):
+    """Returns a Waymark, a seed string for a world_meta line, or None for a blank line; raises ValueError if unreadable."""
+    if not line.strip(): return None
+    if fmt == "tsv":
+        fields = line.rstrip("\r\n").split("\t")
+        if len(fields) < 4: raise ValueError("expected desc, x, y, z [, dimension]")
+        dimension = fields[4].strip().lower() if len(fields) > 4 and fields[4].strip() else "overworld"
+        if dimension not in Waymark.DIMENSIONS: raise ValueError(f"unknown dimension {dimension!r}")
+        return Waymark.from_input(*fields[:4], dimension)
+    data = json.loads(line)
+    if not isinstance(data, dict): raise ValueError("expected a JSON object")
+    if data.get("type") == "world_meta": return str(data.get("seed", ""))
+    entry = Waymark.from_dict(data)
+    entry.id = core.new_entry_id() # Imports add new waymarks; reusing IDs would clash with the world they were exported from
+    return entry
+
+def format_line(entry, fmt, distance=None):
+    if fmt == "tsv":
+        fields = [" ".join(entry.desc.split()), core.format_coordinate(entry.x), core.format_coordinate(entry.y),
+                  core.format_coordinate(entry.z), entry.dimension.value]
+        if distance is not None: fields.append(f"{distance:.1f}")
+        return "\t".join(fields) + "\n"
+    data = entry.to_dict()
+    if distance is not None: data["distance"] = round(distance, 1)
+    return json.dumps(data, separators=(",", ":")) + "\n"
+
+# --- COMMANDS ---
+def require_world(store, name):
+    if name in store.list_worlds(): return True
+    print(f"waymark: no world named {name!r}", file=sys.stderr)
+    return False
+
+def ensure_world(store, name):
+    if name not in store.list_worlds(): store.create_world(name)
+
+def cmd_list(store, args):
+    for world in store.catalog():
+        sys.stdout.write(f"{world['name']}\t{world['entries']}\t{world['seed']}\t{world['modified']}\n")
+    return 0
+
+def cmd_add(store, args):
+    try:
+        entry = Waymark.from_input(args.desc, args.x, args.y, args.z, args.dimension)
+    except InvalidWaymark as e:
+        print(f"waymark: {e}", file=sys.stderr)
+        return 1
+    ensure_world(store, args.world)
+    if args.image:
+        images = ImageStore(store)
+        entry.image = images.put(args.image)
+        images.retain(entry.image)
+        make_thumbnail(entry.image)
+    store.insert_entry(args.world, entry)
+    sys.stdout.write(entry.id + "\n")
+    return 0
+
+def report_import(world, added, skipped):
+    print(f"waymark: imported {added} waymarks into {world}" + (f", skipped {skipped}" if skipped else ""), file=sys.stderr)
+    return 1 if skipped else 0
+
+def cmd_import(store, args):
+    """Streams records from stdin into the world, IMPORT_BATCH lines per write; unreadable lines are reported and skipped."""
+    ensure_world(store, args.world)
+    if args.paths: return import_waypoint_files(store, args)
+    images = ImageStore(store)
+    batch, added, skipped = [], 0, 0
+
+    def flush():
+        nonlocal added
+        if not batch: return
+        store.insert_entries(args.world, batch)
+        images.retain(*(e.image for e in batch)) # Only counts screenshots that already live in the store
+        added += len(batch)
+        batch.clear()
+
+    for number, line in enumerate(sys.stdin, 1):
+        try:
+            record = parse_line(line, args.format or "jsonl")
+        except ValueError as e:
+            print(f"waymark: line {number} skipped: {e}", file=sys.stderr)
+            skipped += 1
+            continue
+        if isinstance(record, str): store.set_seed(args.world, record)
+        elif record:
+            batch.append(record)
+            if len(batch) >= IMPORT_BATCH: flush()
+    flush()
+    return report_import(args.world, added, skipped)
+
+def import_waypoint_files(store, args):
+    """Imports minimap waypoint files, one batched write per file. A file's seed is kept only if the world has none."""
+    added = skipped = 0
+    for path in args.paths:
+        try:
+            entries, seed, bad = read_waypoint_file(path, args.format, Dimension(args.dimension) if args.dimension else None)
+        except (OSError, ValueError) as e:
+            print(f"waymark: {path} skipped: {e}", file=sys.stderr)
+            skipped += 1
+            continue
+        if entries: store.insert_entries(args.world, entries)
+        if seed and not store.load_world(args.world, 0)[1]: store.set_seed(args.world, seed)
+        added += len(entries); skipped += bad
+    return report_import(args.world, added, skipped)
+
+def matching_entries(store, args):
+    """Applies the query filters: (None, record) pairs streamed oldest first, or (distance, record) closest first with --near."""
+    dimension = Dimension(args.dimension) if args.dimension else None
+    if args.near is None:
+        matches = filter(waymark_filter(args.text, dimension), store.iter_entries(args.world))
+        return ((None, entry) for entry in itertools.islice(matches, args.limit))
+    x, z = args.near
+    matches = filter(waymark_filter(args.text, dimension, (x, z), args.radius), store.iter_entries(args.world))
+    if args.radius is None: return nearest_entries(matches, x, z, args.limit or core.NEAREST_RESULTS)
+    return sorted(((math.hypot(e.x - x, e.z - z), e) for e in matches), key=lambda hit: hit[0])[:args.limit]
+
+def cmd_query(store, args):
+    if not require_world(store, args.world): return 1
+    for distance, entry in matching_entries(store, args): sys.stdout.write(format_line(entry, args.format, distance))
+    return 0
+
+def cmd_export(store, args):
+    """Line formats and CSV, GeoJSON and VoxelMap go to stdout unless --output is given; Xaero and JourneyMap need a folder."""
+    if not require_world(store, args.world): return 1
+    entries = (entry for _, entry in matching_entries(store, args))
+    if args.format in FORMATS:
+        for entry in entries: sys.stdout.write(format_line(entry, args.format))
+    elif args.output:
+        count = export_waymarks(entries, args.format, args.output, store.load_world(args.world, 0)[1])
+        print(f"waymark: exported {count} waymarks to {args.output}", file=sys.stderr)
+    else:
+        WRITERS[args.format](entries, sys.stdout, store.load_world(args.world, 0)[1])
+    return 0
+
+def cmd_bundle(store, args):
+    if not require_world(store, args.world): return 1
+    count = export_bundle(store, args.world, args.output)
+    print(f"waymark: bundled {count} waymarks into {args.output}", file=sys.stderr)
+    return 0
+
+def cmd_unbundle(store, args):
+    try:
+        world, count = import_bundle(store, args.path, ImageStore(store), args.world)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"waymark: {e}", file=sys.stderr)
+        return 1
+    print(f"waymark: unbundled {count} waymarks into {world}", file=sys.stderr)
+    sys.stdout.write(world + "\n")
+    return 0
+
+def cmd_merge(store, args):
+    """
+    Merges a friend's bundle into the world. Each conflict is settled by --conflicts and printed as a JSON
+    line, as is each waymark deleted because their copy deleted it.
+    """
+    if not require_world(store, args.world): return 1
+    world = World.load(store, args.world)
+    try:
+        plan = plan_merge(world, args.path)
+        theirs = {i for i, conflict in enumerate(plan.conflicts) if CONFLICT_RULES[args.conflicts](conflict)}
+        # Reported before applying: taking their version overwrites ours in place
+        reports = [json.dumps({"kept": "theirs" if i in theirs else "mine", "mine": ours and ours.to_dict(), "theirs": record and record.to_dict()},
+                              separators=(",", ":")) + "\n" for i, (ours, record) in enumerate(plan.conflicts)]
+        added, changed, removed = plan.apply(ImageStore(store), theirs)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"waymark: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.writelines(reports)
+    sys.stdout.writelines(json.dumps({"removed": e.to_dict()}, separators=(",", ":")) + "\n" for e in removed)
+    print(f"waymark: merged into {args.world}: {len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+          f"{len(plan.conflicts)} conflicts", file=sys.stderr)
+    return 0
+
+def cmd_compact(store, args):
+    names = args.worlds or store.list_worlds()
+    if not all(require_world(store, name) for name in names): return 1
+    if isinstance(store, core.SqliteWorldStore): store.compact()
+    else:
+        for name in names: store.compact(name)
+    return 0
+
+# --- ENTRY POINT ---
+def coordinate_argument(value):
+    try: return core.parse_coordinate(value, "near")
+    except InvalidWaymark as e: raise argparse.ArgumentTypeError(str(e)) from None
+
+def radius_argument(value):
+    try: return core.parse_radius(value)
+    except InvalidWaymark as e: raise argparse.ArgumentTypeError(str(e)) from None
+
+def add_filter_arguments(parser):
+    parser.add_argument("world")
+    parser.add_argument("--text", default="", help="Description contains this (case-insensitive)")
+    parser.add_argument("--dimension", choices=[d.value for d in Dimension])
+    parser.add_argument("--near", nargs=2, type=coordinate_argument, metavar=("X", "Z"))
+    parser.add_argument("--radius", type=radius_argument, help="Blocks from --near; without it the closest --limit are listed")
+    parser.add_argument("--limit", type=int)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="waymark", description="Work with Waymark worlds without opening the app.")
+    parser.add_argument("--engine", choices=["sqlite", "journal"], help="Storage engine (default: $WAYMARK_STORAGE or sqlite)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List worlds: name, waymarks, seed, last modified (tab separated)").set_defaults(run=cmd_list)
+
+    add = commands.add_parser("add", help="Add one waymark and print its ID")
+    add.add_argument("world"); add.add_argument("desc")
+    for axis in ("x", "y", "z"): add.add_argument(axis)
+    add.add_argument("--dimension", choices=[d.value for d in Dimension], default=Dimension.OVERWORLD.value)
+    add.add_argument("--image", metavar="PATH", help="Screenshot to attach")
+    add.set_defaults(run=cmd_add)
+
+    imp = commands.add_parser("import", help="Add waymarks read line by line from stdin, or from minimap waypoint files")
+    imp.add_argument("world")
+    imp.add_argument("paths", nargs="*", metavar="FILE", help="Xaero .txt, VoxelMap .points or JourneyMap .json files/folders")
+    imp.add_argument("--format", choices=FORMATS + tuple(READERS), help="stdin: jsonl (default) or tsv; files: guessed from the name")
+    imp.add_argument("--dimension", choices=[d.value for d in Dimension], help="Override the dimension the waypoint files say")
+    imp.set_defaults(run=cmd_import)
+
+    query = commands.add_parser("query", help="Print matching waymarks (closest first with --near)")
+    add_filter_arguments(query)
+    query.add_argument("--format", choices=FORMATS, default="jsonl")
+    query.set_defaults(run=cmd_query)
+
+    export = commands.add_parser("export", help="Write every waymark (or the ones matching the filters), oldest first")
+    add_filter_arguments(export)
+    export.add_argument("--format", choices=FORMATS + tuple(WRITERS), default="jsonl")
+    export.add_argument("-o", "--output", metavar="PATH", help="File to write (a folder for xaero and journeymap)")
+    export.set_defaults(run=cmd_export)
+
+    bundle = commands.add_parser("bundle", help="Pack a world and its screenshots into one shareable .waymark file")
+    bundle.add_argument("world")
+    bundle.add_argument("-o", "--output", metavar="PATH", required=True)
+    bundle.set_defaults(run=cmd_bundle)
+
+    unbundle = commands.add_parser("unbundle", help="Add a .waymark bundle as a new world and print its name")
+    unbundle.add_argument("path")
+    unbundle.add_argument("--world", metavar="NAME", help="Name for the new world (default: the bundled world's, made unique)")
+    unbundle.set_defaults(run=cmd_unbundle)
+
+    merge = commands.add_parser("merge", help="Merge a friend's bundle of a world back into it, printing any conflicts")
+    merge.add_argument("world"); merge.add_argument("path")
+    merge.add_argument("--conflicts", choices=list(CONFLICT_RULES), default="mine", help="Whose version wins where both changed a waymark")
+    merge.set_defaults(run=cmd_merge)
+
+    compact = commands.add_parser("compact", help="Fold journals into snapshots (sqlite: vacuum the database)")
+    compact.add_argument("worlds", nargs="*")
+    compact.set_defaults(run=cmd_compact)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command in ("query", "export"):
+        if args.radius is not None and args.near is None: parser.error("--radius needs --near")
+        if args.near is not None and not args.dimension: parser.error("--near needs --dimension")
+    if args.command == "import":
+        if args.paths and args.format in FORMATS: parser.error(f"{args.format} is read from stdin, not from files")
+        if not args.paths and args.format in READERS: parser.error(f"{args.format} imports need waypoint files")
+    if args.command == "export" and args.format in FOLDER_FORMATS and not args.output: parser.error(f"{args.format} exports need --output FOLDER")
+    if args.engine: core.STORAGE_ENGINE = args.engine
+    store = core.open_world_store()
+    try:
+        return args.run(store, args)
+    except BrokenPipeError:
+        # Reader went away (e.g. `| head`); keep the interpreter from complaining on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1156 @@
+"""
+Waymark core: the record model, storage engines, image store, indexes and
+queries behind the app. Nothing here imports Flet, and importing it touches no
+files; folders are created when a store is first opened.
+"""
+import hashlib
+import heapq
+import math
+import json
+import marshal
+import os
+from datetime import datetime
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from enum import Enum
+
+# --- GLOBAL CONFIGURATION ---
+# This finds the user's "AppData/Roaming" folder automatically (~/.local/share outside Windows)
+APP_DATA_ROOT = os.path.join(os.environ.get("APPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share"), "WaymarkApp")
+STORAGE_DIR = os.path.join(APP_DATA_ROOT, "waymark_data")
+IMAGE_DIR = os.path.join(STORAGE_DIR, "images")
+THUMB_DIR = os.path.join(IMAGE_DIR, "thumbs")
+DB_PATH = os.path.join(STORAGE_DIR, "waymark.db")
+SESSION_PATH = os.path.join(APP_DATA_ROOT, "session.json") # Last world, search and scroll offset
+# "sqlite" keeps every world in DB_PATH; "journal" keeps portable <world>.json snapshots plus an append-only log
+STORAGE_ENGINE = os.environ.get("WAYMARK_STORAGE", "sqlite")
+JOURNAL_COMPACT_RECORDS = 500
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+SPATIAL_CELL = 256        # Finest grid cell size in blocks for the nearest-waymark index
+SPATIAL_LEVELS = 4        # Grid levels, each SPATIAL_LEVEL_STEP times coarser than the last
+SPATIAL_LEVEL_STEP = 16
+SPATIAL_RING_BUDGET = 256 # Cells a query may visit on one level before moving up a level
+NEAREST_RESULTS = 50      # Waymarks listed by a "Near X/Z" query without a radius
+THUMB_SIZE = (240, 160)   # Twice the 120x80 card tile, so thumbnails stay sharp on HiDPI screens
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")
+IMAGE_GC_GRACE = 24 * 3600    # Unused screenshots younger than this are kept, in case they are about to be attached
+IMAGE_GC_BATCH = 50           # Files examined per step before the collector yields
+IMAGE_GC_PAUSE = 0.05         # Seconds the collector sleeps between steps
+
+def ensure_storage_dirs():
+    """Creates the folders in the user's home directory instead of Program Files."""
+    for d in [APP_DATA_ROOT, STORAGE_DIR, IMAGE_DIR, THUMB_DIR]:
+        if not os.path.exists(d):
+            try:
+                os.makedirs(d)
+            except PermissionError:
+                # Fallback for extreme cases: save to the current directory
+                # (only happens if AppData is somehow locked)
+                pass
+
+# --- RECORD MODEL ---
+def new_entry_id():
+    """Returns a fresh, globally unique waymark ID."""
+    return uuid.uuid4().hex
+
+class Dimension(str, Enum):
+    OVERWORLD = "overworld"
+    NETHER = "nether"
+
+class InvalidWaymark(ValueError):
+    """Raised when form input cannot become a Waymark; `field` names the offending input."""
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+LEGACY_TIME_FORMAT = "%m/%d %H:%M"
+
+def parse_timestamp(value):
+    """Reads an ISO timestamp, or the year-less legacy format (assumed to be from this year)."""
+    if isinstance(value, datetime) or not value: return value or None
+    try: return datetime.fromisoformat(value)
+    except ValueError: pass
+    try: return datetime.strptime(f"{datetime.now().year}/{value}", "%Y/" + LEGACY_TIME_FORMAT)
+    except ValueError: return None
+
+def format_timestamp(value):
+    return value.isoformat(timespec="minutes") if value else ""
+
+def parse_coordinate(value, axis):
+    """Parses one typed coordinate; a blank field means 0."""
+    if value is None or str(value).strip() == "": return 0.0
+    try: number = float(value)
+    except ValueError: raise InvalidWaymark(axis, f"{axis.upper()} must be a number") from None
+    if not math.isfinite(number): raise InvalidWaymark(axis, f"{axis.upper()} must be a finite number")
+    return number
+
+def parse_radius(value):
+    """Parses a typed search radius; blank means no radius (None)."""
+    if value is None or str(value).strip() == "": return None
+    radius = parse_coordinate(value, "radius")
+    if radius < 0: raise InvalidWaymark("radius", "RADIUS can't be negative")
+    return radius
+
+def format_coordinate(value):
+    """Renders a coordinate the way a player would type it back in."""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class Waymark:
+    """
+    One coordinate entry. Coordinates are floats parsed once on the way in, the
+    dimension is an interned enum member and timestamps are real datetimes.
+    """
+    __slots__ = ("id", "desc", "x", "y", "z", "dimension", "created", "modified", "image")
+    DIMENSIONS = {d.value: d for d in Dimension}
+
+    def __init__(self, desc, x, y, z, dimension=Dimension.OVERWORLD, created=None, modified=None, image="", id=None):
+        self.id = id or new_entry_id()
+        self.desc = desc
+        self.x, self.y, self.z = x, y, z
+        self.dimension = Dimension(dimension)
+        self.created = created or datetime.now().replace(second=0, microsecond=0)
+        self.modified = modified or self.created
+        self.image = image or ""
+
+    @classmethod
+    def from_input(cls, desc, x, y, z, dimension, **fields):
+        """Validates raw form input; raises InvalidWaymark for the first bad field."""
+        if not desc or not desc.strip(): raise InvalidWaymark("desc", "Description is required")
+        return cls(desc, parse_coordinate(x, "x"), parse_coordinate(y, "y"), parse_coordinate(z, "z"), dimension, **fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a record from its JSON form, tolerating legacy string coordinates and timestamps."""
+        coords = []
+        for axis in ("x", "y", "z"):
+            # Legacy files hold whatever the user typed; unreadable values fall back to 0
+            try: coords.append(parse_coordinate(data.get(axis), axis))
+            except InvalidWaymark: coords.append(0.0)
+        try: dimension = Dimension(data.get("dimension", "overworld"))
+        except ValueError: dimension = Dimension.OVERWORLD
+        return cls(str(data.get("desc", "")), *coords, dimension, parse_timestamp(data.get("created")),
+                   parse_timestamp(data.get("modified")), data.get("image") or "", data.get("id"))
+
+    def to_dict(self):
+        """Returns the JSON form written to world files and journals."""
+        return {
+            "id": self.id, "desc": self.desc, "x": self.x, "y": self.y, "z": self.z,
+            "dimension": self.dimension.value, "created": format_timestamp(self.created),
+            "modified": format_timestamp(self.modified), "image": self.image
+        }
+
+    def to_row(self):
+        """Returns the record as a flat tuple of plain values, in `__slots__` order."""
+        return tuple(self.to_dict().values())
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuilds a record from to_row output, skipping from_dict's legacy checks (and __init__) for bulk loads."""
+        entry = cls.__new__(cls)
+        entry.id, entry.desc, entry.x, entry.y, entry.z, dimension, created, modified, entry.image = row
+        entry.dimension = cls.DIMENSIONS[dimension]
+        entry.created, entry.modified = datetime.fromisoformat(created), datetime.fromisoformat(modified)
+        return entry
+
+def linked_coordinates(entry):
+    """Returns the (x, z) of the matching spot in the other dimension: nether blocks span 8 overworld ones."""
+    if entry.dimension is Dimension.OVERWORLD: return entry.x / 8, entry.z / 8
+    return entry.x * 8, entry.z * 8
+
+def teleport_command(entry):
+    return f"/tp {entry.x:.2f} {entry.y:.2f} {entry.z:.2f}"
+
+# --- STORAGE ENGINE ---
+
+class SqliteWorldStore:
+    """
+    Keeps every world in a single SQLite database. Each mutation touches exactly
+    one row instead of rewriting the whole world file.
+    """
+    SCHEMA_VERSION = 1
+    ENTRY_FIELDS = ("id", "desc", "x", "y", "z", "dimension", "created", "modified", "image")
+    CATALOG_FIELDS = ("name", "entries", "seed", "modified")
+
+    def __init__(self, path=DB_PATH):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            self.create_schema()
+            # The migration commits as a whole and only then marks the schema current, so a failed one runs again next start
+            with self.lock, self.conn:
+                self.conn.execute("BEGIN")
+                migrated = self.migrate_json_worlds(os.path.dirname(path))
+                self.refresh_catalog()
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            for file in migrated: os.replace(file, file + ".migrated")
+
+    def create_schema(self):
+        """Creates the world and waymark tables plus their lookup indexes."""
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS worlds (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    seed TEXT NOT NULL DEFAULT '',
+                    entries INTEGER NOT NULL DEFAULT 0,
+                    modified TEXT NOT NULL DEFAULT ''
+                );
+                CREATE TABLE IF NOT EXISTS waymarks (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL,
+                    world_id INTEGER NOT NULL REFERENCES worlds(id) ON DELETE CASCADE,
+                    desc TEXT NOT NULL,
+                    x NUMERIC, y NUMERIC, z NUMERIC,
+                    dimension TEXT NOT NULL DEFAULT 'overworld',
+                    created TEXT, modified TEXT,
+                    image TEXT NOT NULL DEFAULT ''
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_waymarks_id ON waymarks(id);
+                CREATE INDEX IF NOT EXISTS idx_waymarks_dimension ON waymarks(world_id, dimension);
+                CREATE INDEX IF NOT EXISTS idx_waymarks_created ON waymarks(world_id, created);
+                CREATE INDEX IF NOT EXISTS idx_waymarks_modified ON waymarks(world_id, modified);
+                CREATE INDEX IF NOT EXISTS idx_waymarks_coords ON waymarks(world_id, dimension, x, z);
+                CREATE INDEX IF NOT EXISTS idx_waymarks_world_seq ON waymarks(world_id, seq);
+            """)
+
+    def refresh_catalog(self):
+        """Recounts every world's catalog columns from its rows inside the caller's transaction; only needed after a migration."""
+        self.conn.execute("""
+            UPDATE worlds SET
+                entries = (SELECT COUNT(*) FROM waymarks WHERE world_id = worlds.id),
+                modified = COALESCE((SELECT MAX(modified) FROM waymarks WHERE world_id = worlds.id), '')
+        """)
+
+    def migrate_json_worlds(self, directory):
+        """
+        One-shot import of the legacy `<world>.json` files found in `directory`, inside the caller's transaction.
+        Returns the files imported, for the caller to rename to `<world>.json.migrated` once that has committed,
+        so nobody keeps backing up a copy that no longer changes. The journal engine's snapshots are left alone.
+        """
+        migrated, taken = [], set()
+        for file in sorted(os.listdir(directory)):
+            if not file.endswith(".json"): continue
+            world = file[:-len(".json")]
+            if os.path.exists(os.path.join(directory, world + ".journal")): continue
+            try:
+                with open(os.path.join(directory, file), "r") as f: data = json.load(f)
+            except (OSError, ValueError):
+                data = []
+            items = [i for i in data if isinstance(i, dict)] if isinstance(data, list) else []
+            meta = next((i for i in items if i.get("type") == "world_meta"), {})
+            if "generation" in meta: continue # A journal-engine world that hasn't been written to yet
+            entries = []
+            for item in items:
+                if item.get("type") == "world_meta": continue
+                try: entries.append(Waymark.from_dict(item))
+                except (TypeError, ValueError): pass # Nothing the legacy app could have written
+            self.conn.execute("INSERT OR IGNORE INTO worlds (name, seed) VALUES (?, ?)", (world, str(meta.get("seed") or "")))
+            world_id = self.world_id(world)
+            # Legacy files are stored newest-first, so insert them oldest-first; a copied world repeats its IDs
+            for entry in reversed(entries):
+                if entry.id in taken: entry.id = new_entry_id()
+                taken.add(entry.id)
+                self.write_entry(world_id, entry)
+            migrated.append(os.path.join(directory, file))
+        return migrated
+
+    def list_worlds(self):
+        return [r[0] for r in self.conn.execute("SELECT name FROM worlds ORDER BY name")]
+
+    def catalog(self):
+        """Returns a summary dict (name, entries, seed, modified) per world, by name, without touching waymark rows."""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(self.CATALOG_FIELDS)} FROM worlds ORDER BY name").fetchall()
+        return [dict(zip(self.CATALOG_FIELDS, r)) for r in rows]
+
+    def reconcile_catalog(self):
+        """The catalog columns are written in the same transactions as the rows, so there is never drift to repair."""
+        return False
+
+    def touch_world(self, world, delta=0):
+        """Updates a world's catalog columns inside the caller's transaction."""
+        self.conn.execute("UPDATE worlds SET entries = entries + ?, modified = ? WHERE name = ?",
+                          (delta, format_timestamp(datetime.now()), world))
+
+    def world_id(self, name):
+        row = self.conn.execute("SELECT id FROM worlds WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def create_world(self, name):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO worlds (name) VALUES (?)", (name,))
+
+    def delete_world(self, name):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM worlds WHERE name = ?", (name,))
+
+    def set_seed(self, name, seed):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE worlds SET seed = ? WHERE name = ?", (seed or "", name))
+            self.touch_world(name)
+
+    def load_world(self, name, limit=None, keep=True):
+        """Returns (entries newest first, seed) for the world; `limit` keeps only the newest few. Nothing is cached, so `keep` is moot."""
+        with self.lock:
+            row = self.conn.execute("SELECT id, seed FROM worlds WHERE name = ?", (name,)).fetchone()
+            if not row: return [], ""
+            cursor = self.conn.execute(
+                f"SELECT {', '.join(self.ENTRY_FIELDS)} FROM waymarks WHERE world_id = ? ORDER BY seq DESC LIMIT ?",
+                (row[0], -1 if limit is None else limit))
+            return [self.row_to_entry(r) for r in cursor], row[1]
+
+    def iter_entries(self, name, page=1000):
+        """Yields the world's entries oldest first, a page of rows at a time, so streaming a world takes constant memory."""
+        with self.lock: world_id, last = self.world_id(name), 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT seq, {', '.join(self.ENTRY_FIELDS)} FROM waymarks WHERE world_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (world_id, last, page)).fetchall()
+            for row in rows: yield self.row_to_entry(row[1:])
+            if len(rows) < page: return
+            last = rows[-1][0]
+
+    def unload(self, name):
+        """Nothing to free: SQLite worlds aren't held in memory."""
+
+    def existing_ids(self, ids):
+        """Returns which of the given waymark IDs are already taken; IDs are unique across the whole database."""
+        ids = list(ids)
+        with self.lock:
+            return {r[0] for r in self.conn.execute(f"SELECT id FROM waymarks WHERE id IN ({', '.join('?' * len(ids))})", ids)}
+
+    def row_to_entry(self, row):
+        return Waymark.from_dict(dict(zip(self.ENTRY_FIELDS, row)))
+
+    def insert_entry(self, world, entry):
+        with self.lock, self.conn:
+            self.write_entry(self.world_id(world), entry)
+            self.touch_world(world, 1)
+
+    def insert_entries(self, world, entries):
+        """Inserts a batch in one transaction; like repeated insert_entry calls, the last entry ends up newest."""
+        with self.lock, self.conn:
+            world_id = self.world_id(world)
+            for entry in entries: self.write_entry(world_id, entry)
+            self.touch_world(world, len(entries))
+
+    def write_entry(self, world_id, entry):
+        """Inserts one entry inside the caller's transaction."""
+        self.conn.execute(
+            f"INSERT INTO waymarks (world_id, {', '.join(self.ENTRY_FIELDS)}) VALUES (?, {', '.join('?' * len(self.ENTRY_FIELDS))})",
+            (world_id, *self.entry_values(entry)))
+
+    def update_entry(self, world, entry):
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE waymarks SET {', '.join(f'{k} = ?' for k in self.ENTRY_FIELDS)} WHERE id = ?",
+                (*self.entry_values(entry), entry.id))
+            self.touch_world(world)
+
+    def delete_entry(self, world, entry):
+        with self.lock, self.conn:
+            deleted = self.conn.execute("DELETE FROM waymarks WHERE id = ?", (entry.id,)).rowcount
+            self.touch_world(world, -deleted)
+
+    def update_entries(self, world, entries):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"UPDATE waymarks SET {', '.join(f'{k} = ?' for k in self.ENTRY_FIELDS)} WHERE id = ?",
+                ((*self.entry_values(entry), entry.id) for entry in entries))
+            self.touch_world(world)
+
+    def delete_entries(self, world, entries):
+        with self.lock, self.conn:
+            deleted = sum(self.conn.execute("DELETE FROM waymarks WHERE id = ?", (entry.id,)).rowcount for entry in entries)
+            self.touch_world(world, -deleted)
+
+    def entry_values(self, entry):
+        data = entry.to_dict()
+        return tuple(data[k] for k in self.ENTRY_FIELDS)
+
+    def compact(self, name=None):
+        """SQLite reuses freed pages by itself; this shrinks the file by vacuuming the whole database (every world at once)."""
+        with self.lock:
+            self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self.lock: self.conn.close()
+
+class JournalWorldStore:
+    """
+    Keeps each world as a `<world>.json` snapshot (the legacy file format) plus a
+    `<world>.journal` of JSON lines. Every mutation appends one small record; a
+    background compactor folds the journal into a fresh snapshot once it grows.
+    Each snapshot also gets a `<world>.cache` of its parsed records in marshal form,
+    valid while the snapshot's mtime and size match the ones recorded in it.
+    `worlds.catalog` summarizes every world so listing them opens a single file.
+    """
+    CACHE_VERSION = 1
+    CATALOG_FILE = "worlds.catalog"
+
+    def __init__(self, directory=STORAGE_DIR, compact_records=JOURNAL_COMPACT_RECORDS, compact_bytes=JOURNAL_COMPACT_BYTES):
+        self.directory = directory
+        self.compact_records = compact_records
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self.worlds = {} # world name -> replayed in-memory state
+        self.compacting = set()
+        self.summaries = None # world name -> catalog entry, loaded on first use
+
+    def path(self, name, suffix=".json"):
+        return os.path.join(self.directory, f"{name}{suffix}")
+
+    def list_worlds(self):
+        return [w["name"] for w in self.catalog()]
+
+    def scan_worlds(self):
+        return sorted(f[:-len(".json")] for f in os.listdir(self.directory) if f.endswith(".json"))
+
+    # --- WORLD CATALOG ---
+    # Each summary carries a stat fingerprint of the world's files. Our own writes
+    # update it right after touching those files, so a mismatch means the world
+    # was changed outside the app (or we crashed in between) and must be re-read.
+    def catalog(self):
+        """Returns a summary dict (name, entries, seed, modified) per world, by name."""
+        with self.lock:
+            return [{"name": name, **summary} for name, summary in sorted(self.load_catalog().items())]
+
+    def load_catalog(self):
+        if self.summaries is None:
+            try:
+                with open(os.path.join(self.directory, self.CATALOG_FILE), "r") as f: self.summaries = json.load(f)
+            except (OSError, ValueError):
+                # First run or unreadable: rebuild once by reading every world
+                self.summaries = {}
+                for name in self.scan_worlds():
+                    if name not in self.worlds: self.replay(name); self.unload(name)
+                self.save_catalog()
+        return self.summaries
+
+    def save_catalog(self):
+        tmp = os.path.join(self.directory, self.CATALOG_FILE + ".tmp")
+        with open(tmp, "w") as f: json.dump(self.summaries, f)
+        os.replace(tmp, os.path.join(self.directory, self.CATALOG_FILE))
+
+    def fingerprint(self, name):
+        """Stat-only identity of a world's snapshot and journal."""
+        fp = []
+        for suffix in (".json", ".journal"):
+            try:
+                stat = os.stat(self.path(name, suffix))
+                fp += [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                fp += [0, 0]
+        return fp
+
+    def note_world(self, name, state, modified=None):
+        """Records a world's summary right after its files were written or re-read; `modified` defaults to the last one."""
+        summaries = self.load_catalog()
+        modified = format_timestamp(modified) if modified else summaries.get(name, {}).get("modified", "")
+        summaries[name] = {"entries": len(state["entries"]), "seed": state["seed"], "modified": modified, "fingerprint": self.fingerprint(name)}
+        self.save_catalog()
+
+    def reconcile_catalog(self):
+        """Stats every world file and re-reads only the worlds changed outside the app. Returns True if any were."""
+        with self.lock:
+            summaries = self.load_catalog()
+            names = set(self.scan_worlds())
+            gone = [n for n in summaries if n not in names]
+            stale = [n for n in sorted(names) if n not in self.compacting and
+                     (n not in summaries or summaries[n]["fingerprint"] != self.fingerprint(n))]
+            for name in gone: del summaries[name]
+            for name in stale:
+                loaded = self.worlds.pop(name, None)
+                self.replay(name)
+                if loaded is None: self.unload(name) # Only the catalog needed it
+            if gone: self.save_catalog()
+            return bool(gone or stale)
+
+    def create_world(self, name):
+        with self.lock:
+            if not os.path.exists(self.path(name)): self.write_snapshot(name, [], "", 0)
+            self.note_world(name, {"entries": [], "seed": ""}, datetime.now())
+
+    def delete_world(self, name):
+        with self.lock:
+            self.worlds.pop(name, None)
+            for suffix in (".json", ".journal", ".journal.old", ".cache"):
+                if os.path.exists(self.path(name, suffix)): os.remove(self.path(name, suffix))
+            if self.load_catalog().pop(name, None) is not None: self.save_catalog()
+
+    def load_world(self, name, limit=None, keep=True):
+        """
+        Returns (entries newest first, seed) for the world; `limit` keeps only the newest few. With keep=False
+        a world that wasn't in memory yet is dropped again afterwards, for one-off reads of every world.
+        """
+        with self.lock:
+            loaded = name in self.worlds
+            state = self.worlds.get(name) or self.replay(name)
+            if not (keep or loaded): self.unload(name)
+            return state["entries"][:limit], state["seed"]
+
+    def unload(self, name):
+        """Frees a world's replayed records; the next read replays it again. A world being compacted stays."""
+        with self.lock:
+            if name not in self.compacting: self.worlds.pop(name, None)
+
+    def existing_ids(self, ids):
+        """IDs only have to be unique within a world here, and every world has its own files."""
+        return set()
+
+    def iter_entries(self, name):
+        """Yields the world's entries oldest first. The journal engine keeps replayed worlds in memory anyway."""
+        with self.lock:
+            entries = list((self.worlds.get(name) or self.replay(name))["entries"])
+        return reversed(entries)
+
+    def replay(self, name):
+        """Loads the last snapshot and applies every journal record written on top of it."""
+        backfilled = False
+        cached = self.read_cache(name)
+        if cached:
+            entries, seed, generation = cached
+        else:
+            entries, seed, generation = [], "", 0
+            try:
+                with open(self.path(name), "r") as f: data = json.load(f)
+            except (OSError, ValueError):
+                data = []
+            # Legacy entries have no ID yet; backfilled IDs must reach disk before any record can refer to them
+            for item in data if isinstance(data, list) else []:
+                if item.get("type") == "world_meta":
+                    seed, generation = item.get("seed", ""), item.get("generation", 0)
+                else:
+                    backfilled = backfilled or "id" not in item
+                    entries.append(Waymark.from_dict(item))
+            if data and not backfilled: self.write_cache(name, [e.to_row() for e in entries], seed, generation)
+
+        state = {"entries": entries, "index": {e.id: e for e in entries}, "seed": seed, "generation": generation,
+                 "records": 0, "bytes": 0, "backfilled": backfilled}
+        for suffix in (".journal.old", ".journal"):
+            for record in self.read_journal(name, suffix):
+                if record.get("op") == "open":
+                    # Segments older than the snapshot were already folded in by a finished compaction
+                    if record["generation"] < generation: break
+                    state["generation"] = max(state["generation"], record["generation"])
+                else:
+                    self.apply(state, record)
+                    state["records"] += 1
+        self.worlds[name] = state
+
+        if state.pop("backfilled") or os.path.exists(self.path(name, ".journal.old")):
+            # Fold everything now; this also finishes an interrupted compaction so no segment is replayed twice
+            state["generation"] += 1
+            self.write_snapshot(name, [e.to_dict() for e in state["entries"]], state["seed"], state["generation"])
+            if os.path.exists(self.path(name, ".journal.old")): os.remove(self.path(name, ".journal.old"))
+            self.open_journal(name, state["generation"])
+            state["records"] = 0
+        elif not os.path.exists(self.path(name, ".journal")):
+            self.open_journal(name, generation)
+        state["bytes"] = os.path.getsize(self.path(name, ".journal"))
+        # Whatever changed the files last, the newest of their mtimes is when
+        self.note_world(name, state, datetime.fromtimestamp(max(self.fingerprint(name)[::2]) / 1e9).replace(microsecond=0))
+        return state
+
+    def read_journal(self, name, suffix):
+        if not os.path.exists(self.path(name, suffix)): return
+        with open(self.path(name, suffix), "rb+") as f:
+            good = 0
+            for line in f:
+                try: record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError: record = None
+                if record is None:
+                    # Torn final write from a crash (even one that parses, if its newline is missing): drop it
+                    # so later appends start on a clean line
+                    f.truncate(good)
+                    return
+                good += len(line)
+                yield record
+
+    def apply(self, state, record):
+        op, entries, index = record.get("op"), state["entries"], state["index"]
+        if op == "add":
+            entry = Waymark.from_dict(record["entry"])
+            entries.insert(0, entry)
+            index[entry.id] = entry
+        elif op == "edit":
+            entry = Waymark.from_dict(record["entry"])
+            entries[entries.index(index[entry.id])] = index[entry.id] = entry
+        elif op == "delete": entries.remove(index.pop(record["id"]))
+        elif op == "seed": state["seed"] = record["seed"]
+
+    def open_journal(self, name, generation):
+        with open(self.path(name, ".journal"), "w") as f:
+            f.write(json.dumps({"op": "open", "generation": generation}) + "\n")
+
+    def append(self, name, *records):
+        """Durably appends records to the world's journal (one fsync for all of them) and schedules compaction when it is due."""
+        with self.lock:
+            state = self.worlds.get(name) or self.replay(name)
+            lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+            with open(self.path(name, ".journal"), "a") as f:
+                f.write(lines); f.flush(); os.fsync(f.fileno())
+            state["records"] += len(records)
+            state["bytes"] += len(lines)
+            self.note_world(name, state, datetime.now())
+            due = state["records"] >= self.compact_records or state["bytes"] >= self.compact_bytes
+            if due and name not in self.compacting:
+                self.compacting.add(name)
+                threading.Thread(target=self.compact, args=(name,), daemon=True).start()
+
+    def compact(self, name):
+        """Folds the journal into a new snapshot. Mutations keep appending to a fresh journal meanwhile."""
+        try:
+            with self.lock:
+                state = self.worlds.get(name) or self.replay(name)
+                entries, seed = [e.to_dict() for e in state["entries"]], state["seed"]
+                state["generation"] += 1
+                generation = state["generation"]
+                os.replace(self.path(name, ".journal"), self.path(name, ".journal.old"))
+                self.open_journal(name, generation)
+                state["records"] = state["bytes"] = 0
+            self.write_snapshot(name, entries, seed, generation)
+            with self.lock:
+                if os.path.exists(self.path(name, ".journal.old")): os.remove(self.path(name, ".journal.old"))
+                if name not in self.worlds: self.delete_world(name) # Wiped while the snapshot was being written
+                else: self.note_world(name, self.worlds[name])
+        finally:
+            self.compacting.discard(name)
+
+    def write_snapshot(self, name, entries, seed, generation):
+        data = entries + [{"type": "world_meta", "seed": seed, "generation": generation}]
+        tmp = self.path(name, ".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=4); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.path(name))
+        self.write_cache(name, [tuple(item.values()) for item in entries], seed, generation)
+
+    def cache_key(self, name):
+        stat = os.stat(self.path(name))
+        return (self.CACHE_VERSION, marshal.version, stat.st_mtime_ns, stat.st_size)
+
+    def read_cache(self, name):
+        """Returns (entries, seed, generation) from the parsed-world cache, or None if it no longer matches the snapshot."""
+        try:
+            with open(self.path(name, ".cache"), "rb") as f: key, seed, generation, rows = marshal.loads(f.read())
+            if tuple(key) != self.cache_key(name): return None
+            return [Waymark.from_row(row) for row in rows], seed, generation
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            return None # Missing, torn or from another version: parse the JSON instead
+
+    def write_cache(self, name, rows, seed, generation):
+        # Not fsynced: a torn cache just fails to load and is rebuilt from the snapshot
+        tmp = self.path(name, ".cache.tmp")
+        with open(tmp, "wb") as f: f.write(marshal.dumps((self.cache_key(name), seed, generation, rows)))
+        os.replace(tmp, self.path(name, ".cache"))
+
+    def insert_entry(self, world, entry):
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            state["entries"].insert(0, entry)
+            state["index"][entry.id] = entry
+            self.append(world, {"op": "add", "entry": entry.to_dict()})
+
+    def insert_entries(self, world, entries):
+        """Inserts a batch with a single journal write; like repeated insert_entry calls, the last entry ends up newest."""
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            state["entries"][:0] = reversed(entries)
+            state["index"].update((e.id, e) for e in entries)
+            self.append(world, *({"op": "add", "entry": e.to_dict()} for e in entries))
+
+    def update_entry(self, world, entry):
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            current = state["index"][entry.id]
+            if current is not entry:
+                state["entries"][state["entries"].index(current)] = state["index"][entry.id] = entry
+            self.append(world, {"op": "edit", "entry": entry.to_dict()})
+
+    def delete_entry(self, world, entry):
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            state["entries"].remove(state["index"].pop(entry.id))
+            self.append(world, {"op": "delete", "id": entry.id})
+
+    def update_entries(self, world, entries):
+        """Batched update_entry: one pass over the world and one journal write."""
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            replaced = {id(state["index"][e.id]): e for e in entries if state["index"][e.id] is not e}
+            if replaced: state["entries"][:] = [replaced.get(id(e), e) for e in state["entries"]]
+            state["index"].update((e.id, e) for e in entries)
+            self.append(world, *({"op": "edit", "entry": e.to_dict()} for e in entries))
+
+    def delete_entries(self, world, entries):
+        """Batched delete_entry: one pass over the world and one journal write."""
+        with self.lock:
+            state = self.worlds.get(world) or self.replay(world)
+            gone = {e.id for e in entries if state["index"].pop(e.id, None)}
+            state["entries"][:] = [e for e in state["entries"] if e.id not in gone]
+            self.append(world, *({"op": "delete", "id": entry_id} for entry_id in gone))
+
+    def set_seed(self, name, seed):
+        with self.lock:
+            (self.worlds.get(name) or self.replay(name))["seed"] = seed or ""
+            self.append(name, {"op": "seed", "seed": seed or ""})
+
+    def close(self):
+        """Waits for background compactions, so a short-lived process never exits halfway through a snapshot."""
+        while self.compacting: time.sleep(0.05)
+
+def open_world_store():
+    """Opens the storage engine selected by STORAGE_ENGINE, creating the data folders on first use."""
+    ensure_storage_dirs()
+    return JournalWorldStore() if STORAGE_ENGINE == "journal" else SqliteWorldStore()
+
+# --- SESSION ---
+def load_session():
+    try:
+        with open(SESSION_PATH, "r") as f: session = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return session if isinstance(session, dict) else {}
+
+def save_session(session):
+    tmp = SESSION_PATH + ".tmp"
+    with open(tmp, "w") as f: json.dump(session, f)
+    os.replace(tmp, SESSION_PATH)
+
+# --- IMAGE STORE ---
+class ImageStore:
+    """
+    Content-addressed screenshot store shared by every world. Files are named by the SHA-256 of their bytes, so
+    a screenshot attached to many waymarks is stored once; refs.json counts how many waymarks use each file.
+    """
+    HASH_CHUNK = 1 << 20
+
+    def __init__(self, world_store, directory=IMAGE_DIR):
+        self.world_store = world_store
+        self.directory = directory
+        self.refs_path = os.path.join(directory, "refs.json")
+        self.lock = threading.RLock()
+        self.refs = None # File name -> waymarks using it, loaded on first use
+
+    @classmethod
+    def digest(cls, path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(cls.HASH_CHUNK), b""): h.update(chunk)
+        return h.hexdigest()
+
+    def key(self, path):
+        """Returns the store's name for path, or None for an image kept outside the store."""
+        if not path or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory): return None
+        return os.path.basename(path)
+
+    def put(self, source):
+        """Returns the stored path for source's bytes, copying them in only if they aren't stored yet."""
+        ext = os.path.splitext(source)[1].lower() or ".png"
+        stored = os.path.join(self.directory, self.digest(source) + ext)
+        with self.lock:
+            # Touching an unused copy restarts its grace period, so the collector can't remove it under us
+            if os.path.exists(stored):
+                os.utime(stored)
+                return stored
+        tmp = f"{stored}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, stored)
+        return stored
+
+    def put_stream(self, f, ext=".png"):
+        """Like put, for bytes that aren't in a file of their own yet (e.g. a zip member): hashes them while copying them in."""
+        h = hashlib.sha256()
+        tmp = os.path.join(self.directory, f"incoming.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK), b""):
+                h.update(chunk); out.write(chunk)
+        stored = os.path.join(self.directory, h.hexdigest() + ext)
+        with self.lock:
+            if os.path.exists(stored):
+                os.utime(stored); os.remove(tmp)
+            else:
+                os.replace(tmp, stored)
+        return stored
+
+    def load_refs(self):
+        with self.lock:
+            if self.refs is None:
+                try:
+                    with open(self.refs_path, "r") as f: self.refs = json.load(f)
+                except (OSError, ValueError):
+                    self.refs = self.count_refs()
+                    self.save_refs()
+            return self.refs
+
+    def count_refs(self):
+        """Recounts references by reading every world; only needed when refs.json is missing or unreadable."""
+        refs = {}
+        for world in self.world_store.list_worlds():
+            for entry in self.world_store.load_world(world, keep=False)[0]:
+                key = self.key(entry.image)
+                if key: refs[key] = refs.get(key, 0) + 1
+        return refs
+
+    def save_refs(self):
+        tmp = self.refs_path + ".tmp"
+        with open(tmp, "w") as f: json.dump(self.refs, f)
+        os.replace(tmp, self.refs_path)
+
+    def retain(self, *paths):
+        self.adjust(paths, 1)
+
+    def release(self, *paths):
+        """Drops references; files left unreferenced stay on disk until they are collected."""
+        self.adjust(paths, -1)
+
+    def adjust(self, paths, delta):
+        keys = [k for k in map(self.key, paths) if k]
+        if not keys: return
+        with self.lock:
+            refs = self.load_refs()
+            for key in keys:
+                count = refs.get(key, 0) + delta
+                if count > 0: refs[key] = count
+                else: refs.pop(key, None)
+            self.save_refs()
+
+    def ref_count(self, path):
+        return self.load_refs().get(self.key(path), 0)
+
+    def collect(self, grace=IMAGE_GC_GRACE, batch=IMAGE_GC_BATCH, pause=IMAGE_GC_PAUSE):
+        """
+        Deletes stored screenshots (and their thumbnails) that no waymark in any world uses and that are older
+        than `grace` seconds. Works a world or a batch of files at a time, sleeping in between, so it can run
+        beside the UI. Returns (files removed, bytes reclaimed).
+        """
+        live = set()
+        for world in self.world_store.list_worlds():
+            live.update(filter(None, (self.key(entry.image) for entry in self.world_store.load_world(world, keep=False)[0])))
+            time.sleep(pause)
+        cutoff = time.time() - grace
+        names = [n for n in os.listdir(self.directory) if n.lower().endswith(IMAGE_EXTENSIONS + (".tmp",)) and n not in live]
+        removed = reclaimed = 0
+        for start in range(0, len(names), batch):
+            with self.lock:
+                refs = self.load_refs() # Catches references added since the scan above
+                for name in names[start:start + batch]:
+                    path = os.path.join(self.directory, name)
+                    try:
+                        stat = os.stat(path)
+                        if name in refs or stat.st_mtime > cutoff: continue
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    removed += 1; reclaimed += stat.st_size
+                    thumb = thumbnail_path(path)
+                    if os.path.exists(thumb):
+                        reclaimed += os.path.getsize(thumb); os.remove(thumb)
+            time.sleep(pause)
+        return removed, reclaimed
+
+# --- THUMBNAILS ---
+def thumbnail_path(image_path):
+    return os.path.join(THUMB_DIR, os.path.splitext(os.path.basename(image_path))[0] + ".jpg")
+
+def make_thumbnail(image_path):
+    """Writes a small JPEG thumbnail for a stored screenshot. Returns its path, or "" if one can't be made."""
+    if not image_path: return ""
+    thumb = thumbnail_path(image_path)
+    if os.path.exists(thumb): return thumb
+    try:
+        from PIL import Image # Imported on first use; Pillow is optional, without it cards show the full screenshot
+    except ImportError:
+        return ""
+    try:
+        with Image.open(image_path) as img:
+            img.draft("RGB", THUMB_SIZE) # Lets JPEG sources decode at reduced size
+            img = img.convert("RGB")
+            img.thumbnail(THUMB_SIZE)
+            img.save(thumb + ".tmp", "JPEG", quality=80)
+        os.replace(thumb + ".tmp", thumb)
+    except (OSError, ValueError):
+        return ""
+    return thumb
+
+def card_image_src(image_path):
+    """Prefers the thumbnail; falls back to the original until one exists."""
+    thumb = thumbnail_path(image_path)
+    return thumb if os.path.exists(thumb) else image_path
+
+def backfill_thumbnails(directory=IMAGE_DIR):
+    """Creates thumbnails for stored screenshots that predate them. Returns how many were made."""
+    made = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.exists(thumbnail_path(path)):
+            made += bool(make_thumbnail(path))
+    return made
+
+# --- SEARCH INDEX ---
+class SearchIndex:
+    """
+    Trigram postings over lowercased descriptions. A substring query intersects
+    the postings of its trigrams and only verifies the surviving candidates.
+    """
+    def __init__(self, entries=()):
+        self.postings = {} # trigram -> set of entry IDs
+        self.texts = {}    # entry ID -> lowercased description
+        self.rank = {}     # entry ID -> insertion counter; newest entries rank highest
+        self.counter = 0
+        # Entries arrive newest-first, so rank them from the oldest up
+        for entry in reversed(entries): self.add(entry)
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, entry):
+        text = entry.desc.lower()
+        self.texts[entry.id] = text
+        self.counter += 1
+        self.rank[entry.id] = self.counter
+        for gram in self.trigrams(text): self.postings.setdefault(gram, set()).add(entry.id)
+
+    def remove(self, entry_id):
+        text = self.texts.pop(entry_id, None)
+        if text is None: return
+        del self.rank[entry_id]
+        for gram in self.trigrams(text):
+            ids = self.postings[gram]
+            ids.discard(entry_id)
+            if not ids: del self.postings[gram]
+
+    def update(self, entry):
+        """Re-indexes an edited entry while keeping its place in the display order."""
+        rank = self.rank.get(entry.id)
+        self.remove(entry.id)
+        self.add(entry)
+        if rank is not None: self.rank[entry.id] = rank
+
+    def search(self, term):
+        """Returns the IDs whose description contains `term`, newest first."""
+        term = term.lower()
+        if len(term) < 3:
+            # Too short for trigrams: scan the cached lowercase strings instead of the records
+            matches = [i for i, text in self.texts.items() if term in text]
+        else:
+            postings = sorted((self.postings.get(g, set()) for g in self.trigrams(term)), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            matches = [i for i in candidates if term in self.texts[i]]
+        return sorted(matches, key=self.rank.__getitem__, reverse=True)
+
+# --- SPATIAL INDEX ---
+class SpatialIndex:
+    """
+    Uniform grid hashes over X/Z, one stack per dimension. Each level's cells are
+    SPATIAL_LEVEL_STEP times wider than the last, so queries in sparse worlds
+    climb to a level where the nearby cells are actually populated.
+    """
+    def __init__(self, entries=(), cell=SPATIAL_CELL, levels=SPATIAL_LEVELS):
+        self.sizes = [cell * SPATIAL_LEVEL_STEP ** level for level in range(levels)]
+        self.grids = {}  # dimension -> per-level {(cx, cz): set of entry IDs}
+        self.points = {} # entry ID -> (dimension, x, z)
+        self.bounds = {} # dimension -> [min x, min z, max x, max z] of every point ever added
+        for entry in entries: self.add(entry)
+
+    @staticmethod
+    def cell_of(x, z, size):
+        return (math.floor(x / size), math.floor(z / size))
+
+    def add(self, entry):
+        x, z, dim = entry.x, entry.z, entry.dimension
+        self.points[entry.id] = (dim, x, z)
+        grids = self.grids.setdefault(dim, [{} for _ in self.sizes])
+        for grid, size in zip(grids, self.sizes):
+            grid.setdefault(self.cell_of(x, z, size), set()).add(entry.id)
+        b = self.bounds.setdefault(dim, [x, z, x, z])
+        b[0], b[1], b[2], b[3] = min(b[0], x), min(b[1], z), max(b[2], x), max(b[3], z)
+
+    def remove(self, entry_id):
+        point = self.points.pop(entry_id, None)
+        if point is None: return
+        dim, x, z = point
+        for grid, size in zip(self.grids[dim], self.sizes):
+            key = self.cell_of(x, z, size)
+            grid[key].discard(entry_id)
+            if not grid[key]: del grid[key]
+
+    def update(self, entry):
+        self.remove(entry.id)
+        self.add(entry)
+
+    def distance(self, entry_id, x, z):
+        _, px, pz = self.points[entry_id]
+        return math.hypot(px - x, pz - z)
+
+    def nearest(self, dim, x, z, k=NEAREST_RESULTS):
+        """Returns up to k (distance, entry ID) pairs in `dim`, closest first."""
+        if not self.grids.get(dim, [{}])[0] or k <= 0: return []
+        for grid, size in zip(self.grids[dim], self.sizes):
+            hits = self.ring_search(dim, grid, size, x, z, k)
+            if hits is not None: return hits
+        # Even the coarsest level is too sparse around this point
+        grid = self.grids[dim][0]
+        return sorted((self.distance(i, x, z), i) for ids in grid.values() for i in ids)[:k]
+
+    def ring_search(self, dim, grid, size, x, z, k):
+        """Walks rings of cells outward from (x, z); gives up with None once it has visited SPATIAL_RING_BUDGET cells."""
+        cx, cz = self.cell_of(x, z, size)
+        b = self.bounds[dim]
+        (x0, z0), (x1, z1) = self.cell_of(b[0], b[1], size), self.cell_of(b[2], b[3], size)
+        # Beyond this ring every occupied cell has been visited
+        max_ring = max(cx - x0, x1 - cx, cz - z0, z1 - cz, 0)
+        best = [] # max-heap of (-distance, entry ID)
+        ring = visited = 0
+        while ring <= max_ring:
+            for key in self.ring_cells(cx, cz, ring):
+                for entry_id in grid.get(key, ()):
+                    item = (-self.distance(entry_id, x, z), entry_id)
+                    if len(best) < k: heapq.heappush(best, item)
+                    elif item > best[0]: heapq.heapreplace(best, item)
+            # Points outside the rings walked so far are at least ring * size away
+            if len(best) == k and -best[0][0] <= ring * size: break
+            visited += max(1, 8 * ring)
+            if visited > SPATIAL_RING_BUDGET: return None
+            ring += 1
+        return sorted((-d, i) for d, i in best)
+
+    def within(self, dim, x, z, radius):
+        """Returns every (distance, entry ID) pair in `dim` within `radius` blocks, closest first."""
+        if not self.grids.get(dim): return []
+        for grid, size in zip(self.grids[dim], self.sizes):
+            (x0, z0), (x1, z1) = self.cell_of(x - radius, z - radius, size), self.cell_of(x + radius, z + radius, size)
+            if (x1 - x0 + 1) * (z1 - z0 + 1) <= SPATIAL_RING_BUDGET: break
+        if (x1 - x0 + 1) * (z1 - z0 + 1) > len(grid):
+            keys = [key for key in grid if x0 <= key[0] <= x1 and z0 <= key[1] <= z1]
+        else:
+            keys = [(a, b) for a in range(x0, x1 + 1) for b in range(z0, z1 + 1)]
+        hits = ((self.distance(i, x, z), i) for key in keys for i in grid.get(key, ()))
+        return sorted(hit for hit in hits if hit[0] <= radius)
+
+    @staticmethod
+    def ring_cells(cx, cz, ring):
+        if ring == 0:
+            yield (cx, cz); return
+        for a in range(cx - ring, cx + ring + 1):
+            yield (a, cz - ring); yield (a, cz + ring)
+        for b in range(cz - ring + 1, cz + ring):
+            yield (cx - ring, b); yield (cx + ring, b)
+
+# --- STREAMING QUERIES ---
+# For one-shot passes over a stream of records (CLI, exporters), where building
+# a World's indexes would cost more than the scan they save.
+def waymark_filter(term="", dimension=None, center=None, radius=None):
+    """Returns a predicate: description contains `term`, record is in `dimension` and within `radius` of center (x, z)."""
+    term = (term or "").lower()
+    def matches(entry):
+        if dimension and entry.dimension is not dimension: return False
+        if term and term not in entry.desc.lower(): return False
+        return radius is None or math.hypot(entry.x - center[0], entry.z - center[1]) <= radius
+    return matches
+
+def nearest_entries(entries, x, z, k=NEAREST_RESULTS):
+    """Returns the k (distance, record) pairs closest to (x, z) from a stream of records, holding only k at a time."""
+    return heapq.nsmallest(k, ((math.hypot(e.x - x, e.z - z), e) for e in entries), key=lambda hit: hit[0])
+
+# --- WORLDS ---
+class World:
+    """
+    One loaded world: its records newest first, an ID index and the search and
+    spatial indexes over them. Mutations are written to the store, then applied here.
+    """
+    def __init__(self, store, name, entries=(), seed=""):
+        self.store = store
+        self.name = name
+        self.seed = seed
+        self.entries = list(entries)
+        self.index = {e.id: e for e in self.entries}
+        self.search_index = SearchIndex(self.entries)
+        self.spatial_index = SpatialIndex(self.entries)
+
+    @classmethod
+    def load(cls, store, name, limit=None):
+        """Reads the world from the store; `limit` keeps only the newest few records."""
+        entries, seed = store.load_world(name, limit)
+        return cls(store, name, entries, seed)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, entry_id):
+        return self.index.get(entry_id)
+
+    def add(self, entry):
+        self.store.insert_entry(self.name, entry)
+        self.entries.insert(0, entry)
+        self.index[entry.id] = entry
+        self.search_index.add(entry)
+        self.spatial_index.add(entry)
+
+    def add_many(self, entries):
+        """Adds a list of records in one store write; as with repeated add calls, the last one ends up newest."""
+        self.store.insert_entries(self.name, entries)
+        self.entries[:0] = reversed(entries)
+        for entry in entries:
+            self.index[entry.id] = entry
+            self.search_index.add(entry)
+            self.spatial_index.add(entry)
+
+    def update(self, entry):
+        """Persists changes already made to the record's fields and re-indexes it."""
+        self.store.update_entry(self.name, entry)
+        self.search_index.update(entry)
+        self.spatial_index.update(entry)
+
+    def remove(self, entry_id):
+        """Deletes a record by ID and returns it."""
+        entry = self.index[entry_id]
+        self.store.delete_entry(self.name, entry)
+        # IDs are unique, so equality only ever matches this exact record
+        self.entries.remove(self.index.pop(entry_id))
+        self.search_index.remove(entry_id)
+        self.spatial_index.remove(entry_id)
+        return entry
+
+    def update_many(self, entries):
+        """Batched update: one store write for all the records."""
+        self.store.update_entries(self.name, entries)
+        for entry in entries:
+            self.search_index.update(entry)
+            self.spatial_index.update(entry)
+
+    def remove_many(self, entry_ids):
+        """Batched remove: one store write and one pass over the records, however many go. Returns the removed records."""
+        removed = [self.index.pop(i) for i in set(entry_ids) if i in self.index]
+        if not removed: return []
+        self.store.delete_entries(self.name, removed)
+        gone = {e.id for e in removed}
+        self.entries = [e for e in self.entries if e.id not in gone]
+        for entry_id in gone:
+            self.search_index.remove(entry_id)
+            self.spatial_index.remove(entry_id)
+        return removed
+
+    def set_seed(self, seed):
+        self.store.set_seed(self.name, seed)
+        self.seed = seed or ""
+
+    def search(self, term):
+        """Returns the records whose description contains `term`, newest first; an empty term matches all."""
+        if not term: return list(self.entries)
+        return [self.index[i] for i in self.search_index.search(term)]
+
+    def near(self, dimension, x, z, radius=None, k=NEAREST_RESULTS):
+        """Returns (distance, record) pairs in `dimension`, closest first: all within `radius`, else the k nearest."""
+        if radius is not None: hits = self.spatial_index.within(dimension, x, z, radius)
+        else: hits = self.spatial_index.nearest(dimension, x, z, k)
+        return [(distance, self.index[i]) for distance, i in hits]
@@ -0,0 +1,219 @@
+"""
+Minimap waypoint formats (Xaero's Minimap, JourneyMap, VoxelMap) plus CSV and
+GeoJSON exports. Readers go through a file one line (JourneyMap: one waypoint
+file) at a time and map each waypoint onto a Waymark; writers stream records
+out one at a time, so exports never hold the world twice.
+"""
+import csv
+import json
+import math
+import os
+
+from waymark_core import Dimension, InvalidWaymark, Waymark
+
+# Every spelling the mods use for the dimensions Waymark tracks; anything else (the End, modded dimensions) is skipped
+DIMENSION_NAMES = {
+    "0": Dimension.OVERWORLD, "overworld": Dimension.OVERWORLD, "minecraft:overworld": Dimension.OVERWORLD,
+    "-1": Dimension.NETHER, "nether": Dimension.NETHER, "the_nether": Dimension.NETHER, "minecraft:the_nether": Dimension.NETHER,
+}
+
+def dimension_of(value):
+    return DIMENSION_NAMES.get(str(value).strip().lower())
+
+def waypoint(name, x, y, z, dimension):
+    """Returns the Waymark for one waypoint, or None if it can't be one (wrong dimension, bad numbers)."""
+    if dimension is None: return None
+    try: return Waymark.from_input(name, x, y, z, dimension)
+    except InvalidWaymark: return None
+
+# --- XAERO ---
+# <world>/dim%<id>/mw$<set>.txt, one "waypoint:name:initials:x:y:z:color:disabled:type:set:..." per line.
+# The dimension is only in the folder name; colons in names are written as "§§" and an unknown Y as "~".
+def xaero_dimension(path):
+    for part in reversed(os.path.normpath(os.path.abspath(path)).split(os.sep)):
+        if part.startswith("dim%"): return dimension_of(part[len("dim%"):].replace("$", ":"))
+    return Dimension.OVERWORLD
+
+def xaero_waypoint(line, dimension):
+    fields = line.rstrip("\r\n").split(":")
+    if len(fields) < 6: return None
+    name, y = fields[1].replace("§§", ":"), fields[4]
+    return waypoint(name or fields[2], fields[3], "" if y == "~" else y, fields[5], dimension)
+
+def read_xaero(path, dimension=None):
+    dimension = dimension or xaero_dimension(path)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            # Skips comments and the "sets:" header
+            if line.startswith("waypoint:"): yield xaero_waypoint(line, dimension)
+
+# --- JOURNEYMAP ---
+# One JSON object per waypoint file ({"name", "x", "y", "z", "dimensions": [...]}), usually a folder of them
+def read_journeymap(path, dimension=None):
+    paths = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".json")] if os.path.isdir(path) else [path]
+    for file in paths:
+        try:
+            with open(file, "r", encoding="utf-8") as f: data = json.load(f)
+        except (OSError, ValueError):
+            yield None; continue
+        yield journeymap_waypoint(data, dimension)
+
+def journeymap_waypoint(data, dimension=None):
+    if not isinstance(data, dict): return None
+    dims = data.get("dimensions") or [data.get("dimension", 0)]
+    found = dimension or next(filter(None, map(dimension_of, dims)), None)
+    return waypoint(data.get("name", ""), data.get("x"), data.get("y"), data.get("z"), found)
+
+# --- VOXELMAP ---
+# <world>.points: "name:Home,x:1,z:2,y:64,enabled:true,...,dimensions:overworld#the_nether#" per waypoint,
+# after "subworlds:", "oldNorthWorlds:" and "seeds:subworld#seed," header lines. Names escape "," and ":".
+def read_voxelmap(path, dimension=None):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line.startswith("seeds:"):
+                seed = next((s.split("#", 1)[1] for s in line[len("seeds:"):].split(",") if "#" in s and s.split("#", 1)[1]), "")
+                if seed: yield seed
+            if not line.startswith("name:"): continue
+            fields = dict(item.split(":", 1) for item in line.split(",") if ":" in item)
+            found = dimension or next(filter(None, map(dimension_of, fields.get("dimensions", "0").split("#"))), None)
+            name = fields.get("name", "").replace("﹐", ",").replace("˸", ":")
+            yield waypoint(name, fields.get("x"), fields.get("y"), fields.get("z"), found)
+
+READERS = {"xaero": read_xaero, "journeymap": read_journeymap, "voxelmap": read_voxelmap}
+
+def detect_format(path):
+    """Guesses the mod from the file name: .points is VoxelMap, .txt Xaero, .json files or folders JourneyMap."""
+    if os.path.isdir(path) or path.lower().endswith(".json"): return "journeymap"
+    if path.lower().endswith(".points"): return "voxelmap"
+    if path.lower().endswith(".txt"): return "xaero"
+    raise ValueError(f"Can't tell which minimap wrote {os.path.basename(path)!r}")
+
+def read_waypoint_file(path, fmt=None, dimension=None):
+    """
+    Reads one waypoint file (or JourneyMap folder) so it can be committed in a single batched write.
+    Returns (waymarks in file order, seed or "", waypoints skipped). `dimension` overrides what the file says.
+    """
+    entries, seed, skipped = [], "", 0
+    for item in READERS[fmt or detect_format(path)](path, dimension):
+        if isinstance(item, str): seed = seed or item
+        elif item is None: skipped += 1
+        else: entries.append(item)
+    return entries, seed, skipped
+
+# --- EXPORT ---
+# Writers take records in any order and return how many they wrote. Images are
+# exported by file name only: absolute paths mean nothing on another machine.
+FOLDER_FORMATS = ("xaero", "journeymap") # Written as a folder tree, one file per dimension or per waypoint
+EXPORT_EXTENSIONS = {".csv": "csv", ".geojson": "geojson", ".json": "geojson", ".points": "voxelmap"}
+COLORS = {Dimension.OVERWORLD: (0.33, 0.8, 0.33), Dimension.NETHER: (0.8, 0.2, 0.2)}
+XAERO_COLORS = {Dimension.OVERWORLD: 10, Dimension.NETHER: 12} # Xaero's 16-colour palette: green, red
+XAERO_FOLDERS = {Dimension.OVERWORLD: "dim%0", Dimension.NETHER: "dim%-1"}
+XAERO_HEADER = "#\n#waypoint:name:initials:x:y:z:color:disabled:type:set:rotate_on_tp:tp_yaw:visibility_type:destination\n#\nsets:gui.xaero_default\n"
+
+def image_name(entry):
+    return os.path.basename(entry.image) if entry.image else ""
+
+def block(value):
+    """Minimap mods store whole block coordinates."""
+    return math.floor(value)
+
+def write_csv(entries, f, seed=""):
+    writer = csv.writer(f)
+    writer.writerow(Waymark.__slots__)
+    count = 0
+    for entry in entries:
+        writer.writerow((*entry.to_row()[:-1], image_name(entry)))
+        count += 1
+    return count
+
+def write_geojson(entries, f, seed=""):
+    """Points are block X/Z with Y as the altitude; there is no real-world coordinate system behind them."""
+    f.write('{"type":"FeatureCollection","features":[\n')
+    count = 0
+    for entry in entries:
+        properties = entry.to_dict()
+        properties["image"] = image_name(entry)
+        feature = {"type": "Feature", "id": entry.id, "geometry": {"type": "Point", "coordinates": [entry.x, entry.z, entry.y]}, "properties": properties}
+        f.write((",\n" if count else "") + json.dumps(feature, separators=(",", ":")))
+        count += 1
+    f.write("\n]}\n")
+    return count
+
+def write_voxelmap(entries, f, seed=""):
+    f.write(f"subworlds:\noldNorthWorlds:\nseeds:{f'#{seed},' if seed else ''}\n")
+    count = 0
+    for entry in entries:
+        name = " ".join(entry.desc.split()).replace(",", "﹐").replace(":", "˸")
+        red, green, blue = COLORS[entry.dimension]
+        dimension = "overworld" if entry.dimension is Dimension.OVERWORLD else "the_nether"
+        f.write(f"name:{name},x:{block(entry.x)},z:{block(entry.z)},y:{block(entry.y)},enabled:true,"
+                f"red:{red},green:{green},blue:{blue},suffix:,world:,dimensions:{dimension}#\n")
+        count += 1
+    return count
+
+def write_xaero(entries, directory, seed=""):
+    """Writes dim%0 and dim%-1 waypoint files under `directory`, the layout of one world folder in XaeroWaypoints."""
+    files, count = {}, 0
+    try:
+        for entry in entries:
+            f = files.get(entry.dimension)
+            if f is None:
+                folder = os.path.join(directory, XAERO_FOLDERS[entry.dimension])
+                os.makedirs(folder, exist_ok=True)
+                f = files[entry.dimension] = open(os.path.join(folder, "mw$default_1.txt"), "w", encoding="utf-8")
+                f.write(XAERO_HEADER)
+            f.write(xaero_line(entry))
+            count += 1
+    finally:
+        for f in files.values(): f.close()
+    return count
+
+def xaero_line(entry, line=None):
+    """
+    Formats a record as a Xaero waypoint line; given the line it came from, keeps that line's colour, flags and set,
+    and its unknown Y ("~", read as 0) unless the height was edited since.
+    """
+    name = " ".join(entry.desc.split()).replace(":", "§§")
+    fields = [f"{XAERO_COLORS[entry.dimension]}", "false", "0", "gui.xaero_default", "false", "0", "0", "false"]
+    y = str(block(entry.y))
+    if line:
+        source = line.rstrip("\r\n").split(":")
+        if source[4:5] == ["~"] and block(entry.y) == 0: y = "~"
+        fields = source[6:] or fields
+    return ":".join(["waypoint", name, name[:1].upper(), str(block(entry.x)), y, str(block(entry.z)), *fields]) + "\n"
+
+def journeymap_data(entry, base=None):
+    """Returns a record's JourneyMap waypoint object; given the one it came from, keeps its other fields (icon, colour...)."""
+    name = " ".join(entry.desc.split())
+    x, y, z = block(entry.x), block(entry.y), block(entry.z)
+    red, green, blue = (int(c * 255) for c in COLORS[entry.dimension])
+    data = {"id": f"{name}_{x},{y},{z}", "name": name, "icon": "waypoint-normal.png", "x": x, "y": y, "z": z,
+            "r": red, "g": green, "b": blue, "enable": True, "type": "Normal", "origin": "waymark",
+            "dimensions": ["minecraft:overworld" if entry.dimension is Dimension.OVERWORLD else "minecraft:the_nether"], "persistent": True}
+    for key, value in (base or {}).items():
+        if key not in ("id", "name", "x", "y", "z", "dimensions"): data[key] = value
+    return data
+
+def journeymap_file(data):
+    return "".join(c if c.isalnum() or c in "_,-" else "_" for c in data["id"]) + ".json"
+
+def write_journeymap(entries, directory, seed=""):
+    """Writes one JourneyMap waypoint file per record into `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for entry in entries:
+        data = journeymap_data(entry)
+        with open(os.path.join(directory, journeymap_file(data)), "w", encoding="utf-8") as f: json.dump(data, f)
+        count += 1
+    return count
+
+WRITERS = {"csv": write_csv, "geojson": write_geojson, "voxelmap": write_voxelmap, "xaero": write_xaero, "journeymap": write_journeymap}
+
+def export_waymarks(entries, fmt, path, seed=""):
+    """Streams records to `path` (a folder for FOLDER_FORMATS). Returns how many were written."""
+    if fmt in FOLDER_FORMATS: return WRITERS[fmt](entries, path, seed)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f: count = WRITERS[fmt](entries, f, seed)
+    os.replace(tmp, path)
+    return count
@@ -0,0 +1,120 @@
+"""
+Three-way merge of a friend's copy of a world (a .waymark bundle) into the local
+one. Waymarks are matched by ID against the merge base, the newest snapshot both
+copies descend from: whatever only one side added, edited or deleted since then
+is taken from that side, and waymarks both sides changed differently are
+conflicts for the user to settle. Each copy is read once and looked up by ID, so
+merging stays linear in world size.
+"""
+import io
+import os
+import shutil
+import zipfile
+
+import waymark_core as core
+from waymark_bundle import (WAYMARKS, base_writer, bundle_record, keep_base, lineage, load_base, read_manifest,
+                            snapshots, unpack_image)
+
+MERGED_FIELDS = ("desc", "x", "y", "z", "dimension", "created", "modified") # Copied from their side onto ours, along with the image
+
+def content(entry):
+    """What a merge compares: every field but the ID and modified time, with screenshots by their content-hash name."""
+    if entry is None: return None
+    return (entry.desc, entry.x, entry.y, entry.z, entry.dimension, entry.created, os.path.basename(entry.image or ""))
+
+class MergePlan:
+    """
+    What merging a bundle into a loaded World will do. `added` holds their new records, `changed` (ours, theirs)
+    pairs and `removed` our records they deleted; `conflicts` holds (ours, theirs) pairs where both sides
+    changed a waymark differently, with None for a side that deleted it. `base` is the snapshot it was
+    planned against, None if the copies share none. Nothing is written until apply().
+    """
+    def __init__(self, world, path, snapshot=None, base=None):
+        self.world, self.path, self.snapshot, self.base = world, path, snapshot, base
+        self.added, self.changed, self.removed, self.conflicts = [], [], [], []
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed) + len(self.conflicts)
+
+    def classify(self, base, ours, theirs):
+        mine, yours, common = content(ours), content(theirs), content(base)
+        if mine == yours or yours == common: return # Same on both sides, or only we changed it
+        if mine != common: self.conflicts.append((ours, theirs))
+        elif ours is None: self.added.append(theirs)
+        elif theirs is None: self.removed.append(ours)
+        else: self.changed.append((ours, theirs))
+
+    @staticmethod
+    def newer(conflict):
+        """True if their side of a conflict is the more recent edit (a deletion never is)."""
+        ours, theirs = conflict
+        return theirs is not None and (ours is None or theirs.modified > ours.modified)
+
+    def apply(self, images, theirs=()):
+        """
+        Writes the plan to the world, settling the conflicts whose indexes are in `theirs` with their copy
+        and keeping ours for the rest. Their screenshots are unpacked into the image store as they're needed.
+        Their new records get fresh IDs where the database already holds theirs in another world.
+        Returns (added, changed, removed) records as they now are in the world.
+        """
+        added, changed, removed = list(self.added), list(self.changed), list(self.removed)
+        for i in set(theirs):
+            ours, record = self.conflicts[i]
+            if ours is None: added.append(record)
+            elif record is None: removed.append(ours)
+            else: changed.append((ours, record))
+        stored = {}
+        with zipfile.ZipFile(self.path) as zf:
+            members = set(zf.namelist())
+            for record in [*added, *(record for _, record in changed)]:
+                if record.image not in stored: stored[record.image] = unpack_image(zf, members, record.image, images)
+        taken = self.world.store.existing_ids(e.id for e in added) # Held by another world: theirs is added under a fresh ID
+        for record in added:
+            record.image = stored[record.image]
+            if record.id in taken: record.id = core.new_entry_id()
+        replaced = [ours.image for ours, _ in changed]
+        for ours, record in changed:
+            for field in MERGED_FIELDS: setattr(ours, field, getattr(record, field))
+            ours.image = stored[record.image]
+        if added: self.world.add_many(added)
+        if changed: self.world.update_many([ours for ours, _ in changed])
+        removed = self.world.remove_many(e.id for e in removed)
+        images.retain(*(e.image for e in added), *(ours.image for ours, _ in changed))
+        images.release(*replaced, *(e.image for e in removed))
+        # Their snapshot becomes a base too, as both copies now descend from it; unless IDs changed on the way in
+        if self.snapshot is not None and not taken: self.save_base()
+        return added, [ours for ours, _ in changed], removed
+
+    def save_base(self):
+        """Keeps their copy under its snapshot ID."""
+        with zipfile.ZipFile(self.path) as zf, zf.open(WAYMARKS) as src, base_writer(self.world.name, self.snapshot) as base:
+            shutil.copyfileobj(io.TextIOWrapper(src, encoding="utf-8"), base)
+        keep_base(self.world.name, self.snapshot)
+
+def plan_merge(world, path):
+    """
+    Compares a bundle with the world and its merge base: the newest of the world's snapshots the bundle
+    descends from. Without one (a copy of another world, or one that branched off before any snapshot the
+    world still keeps) nothing counts as deleted, waymarks both copies have in different versions are
+    conflicts, and their waymarks already here under other IDs aren't added again.
+    """
+    kept = set(snapshots(world.name))
+    manifest = read_manifest(path)
+    ids = lineage(manifest)
+    snapshot = next((i for i in ids if i in kept), None)
+    try:
+        base = load_base(world.name, snapshot) if snapshot else {}
+    except (OSError, ValueError, TypeError, AttributeError):
+        snapshot, base = None, {} # A damaged base is no base: merging without one never deletes anything
+    ours = dict(world.index)
+    known = set() if snapshot else {content(e) for e in world.entries}
+    plan = MergePlan(world, path, manifest.get("snapshot") if ids[:1] == [manifest.get("snapshot")] else None, snapshot)
+    with zipfile.ZipFile(path) as zf, io.TextIOWrapper(zf.open(WAYMARKS), encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip(): continue
+            theirs = bundle_record(line, number, path)
+            if theirs.id not in ours and content(theirs) in known: continue
+            plan.classify(base.pop(theirs.id, None), ours.pop(theirs.id, None), theirs)
+    # Ours that aren't in their copy: added by us, or deleted by them
+    for entry_id, entry in ours.items(): plan.classify(base.get(entry_id), entry, None)
+    return plan
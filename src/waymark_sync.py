@@ -0,0 +1,222 @@
+"""
+Live two-way sync between a world and a minimap mod: a Xaero waypoint file
+(which holds one dimension) or a JourneyMap waypoints folder. Waypoints are
+matched to waymarks by a stable key, so each side only ever touches the records
+that actually changed. The app polls `changed()`.
+"""
+import json
+import os
+import threading
+
+import waymark_core as core
+from waymark_formats import block, journeymap_data, journeymap_file, journeymap_waypoint, xaero_dimension, xaero_line, xaero_waypoint
+
+SYNC_SUFFIX = ".sync" # <world>.sync in STORAGE_DIR holds the link, next to the world it belongs to
+
+def waypoint_key(entry):
+    """What identifies a waypoint on the mod's side: dimension, name and block position (the mods keep no IDs)."""
+    return (entry.dimension.value, " ".join(entry.desc.split()), block(entry.x), block(entry.y), block(entry.z))
+
+def sync_path(world_name):
+    return os.path.join(core.STORAGE_DIR, world_name + SYNC_SUFFIX)
+
+def unlink_world(world_name):
+    if os.path.exists(sync_path(world_name)): os.remove(sync_path(world_name))
+
+class WaypointSync:
+    """
+    Links a World to a waypoint file or folder. `links` maps each synced
+    waypoint's key to its waymark ID and `fingerprint` is the stat of the mod's
+    files as of the last sync; both are saved so a restart resumes where it left off.
+    """
+    def __init__(self, world, path, fmt, links=(), fingerprint=None):
+        self.world, self.path, self.fmt = world, path, fmt
+        self.links = {}  # waypoint key -> waymark ID
+        self.keys = {}   # waymark ID -> waypoint key
+        for key, entry_id in links: self.remember(key, entry_id)
+        self.fingerprint = fingerprint
+        self.dimensions = (xaero_dimension(path),) if fmt == "xaero" else tuple(core.Dimension)
+        self.files = {}  # JourneyMap: waypoint key -> file name, as of the last read
+        self.lock = threading.RLock()
+
+    @classmethod
+    def open(cls, world):
+        """Returns the world's saved link, or None if it isn't synced with a minimap."""
+        try:
+            with open(sync_path(world.name), "r") as f: state = json.load(f)
+            return cls(world, state["path"], state["format"], [(tuple(k), i) for k, i in state["links"]], state["fingerprint"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def link(cls, world, path):
+        """
+        Starts syncing with a Xaero .txt file or a JourneyMap folder (any waypoint file in it links the folder).
+        Waypoints and waymarks that already match are paired up, the mod's others are added to the world and
+        the world's others are written to the mod. Returns (sync, pull changes).
+        """
+        fmt = "xaero" if path.lower().endswith(".txt") else "journeymap"
+        if fmt == "journeymap" and not os.path.isdir(path): path = os.path.dirname(path)
+        sync = cls(world, path, fmt)
+        with sync.lock:
+            waypoints = sync.read()
+            unsynced = {}
+            for entry in reversed(world.entries):
+                if entry.dimension in sync.dimensions: unsynced.setdefault(waypoint_key(entry), entry)
+            for key in waypoints:
+                if key in unsynced: sync.remember(key, unsynced.pop(key).id)
+            changes = sync.pull(waypoints)
+            sync.push(added=list(unsynced.values()))
+        return sync, changes
+
+    def remember(self, key, entry_id):
+        self.links[key] = entry_id
+        self.keys[entry_id] = key
+
+    def forget(self, key):
+        self.keys.pop(self.links.pop(key), None)
+
+    def save(self):
+        state = {"path": self.path, "format": self.fmt, "fingerprint": self.fingerprint,
+                 "links": [[list(key), entry_id] for key, entry_id in self.links.items()]}
+        tmp = sync_path(self.world.name) + ".tmp"
+        with open(tmp, "w") as f: json.dump(state, f)
+        os.replace(tmp, sync_path(self.world.name))
+
+    # --- MOD SIDE ---
+    def stat(self):
+        """Stat-only identity of the mod's files; JSON-shaped so it compares equal after a save and load."""
+        if self.fmt == "xaero":
+            stat = os.stat(self.path)
+            return [stat.st_mtime_ns, stat.st_size]
+        return sorted([e.name, e.stat().st_mtime_ns, e.stat().st_size] for e in os.scandir(self.path) if e.name.endswith(".json"))
+
+    def changed(self):
+        """True once the mod has written since the last sync. A missing file counts as unchanged, never as 'everything deleted'."""
+        try: return self.stat() != self.fingerprint
+        except OSError: return False
+
+    def read(self):
+        """Returns {key: (record, source)}, where source is the Xaero line or JourneyMap file the waypoint came from."""
+        waypoints = {}
+        if self.fmt == "xaero":
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = xaero_waypoint(line, self.dimensions[0]) if line.startswith("waypoint:") else None
+                    if record: waypoints.setdefault(waypoint_key(record), (record, line))
+            return waypoints
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"): continue
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f: record = journeymap_waypoint(json.load(f))
+            except (OSError, ValueError):
+                continue
+            if record: waypoints.setdefault(waypoint_key(record), (record, name))
+        self.files = {key: name for key, (_, name) in waypoints.items()}
+        return waypoints
+
+    # --- MOD -> WORLD ---
+    def pull(self, waypoints=None):
+        """
+        Applies the mod-side changes since the last sync to the world and returns them as (added, changed,
+        removed) records. A waypoint that vanished and one that appeared with its name or its position count
+        as one edit, so renaming or moving a waypoint in-game keeps the waymark's screenshot and history.
+        """
+        with self.lock:
+            fingerprint = self.stat()
+            if waypoints is None: waypoints = self.read()
+            gone = {key: entry_id for key, entry_id in self.links.items() if key not in waypoints}
+            by_name = {key[:2]: key for key in gone}
+            by_spot = {(key[0], *key[2:]): key for key in gone}
+            added, changed, removed = [], [], []
+            for key, (record, _) in waypoints.items():
+                if key in self.links: continue
+                old = by_name.get(key[:2]) or by_spot.get((key[0], *key[2:]))
+                entry = None
+                if old in gone:
+                    entry = self.world.get(gone.pop(old))
+                    self.forget(old)
+                if entry:
+                    self.apply(entry, record)
+                    changed.append(entry)
+                else:
+                    added.append(record)
+                self.remember(key, (entry or record).id)
+            for key, entry_id in gone.items():
+                self.forget(key)
+                entry = self.world.get(entry_id)
+                if entry: removed.append(entry)
+            if added: self.world.add_many(added)
+            for entry in changed: self.world.update(entry)
+            for entry in removed: self.world.remove(entry.id)
+            self.fingerprint = fingerprint
+            self.save()
+            return added, changed, removed
+
+    @staticmethod
+    def apply(entry, record):
+        """Copies a waypoint onto its waymark; coordinates only where the block changed, so the waymark's decimals survive a rename."""
+        entry.desc, entry.dimension, entry.modified = record.desc, record.dimension, record.created
+        for axis in ("x", "y", "z"):
+            if block(getattr(entry, axis)) != block(getattr(record, axis)): setattr(entry, axis, getattr(record, axis))
+
+    # --- WORLD -> MOD ---
+    def push(self, added=(), changed=(), removed=()):
+        """Writes Waymark-side changes back to the mod, rewriting only the affected Xaero lines or JourneyMap files."""
+        with self.lock:
+            adds, replaces, drops = [], {}, set()
+            present = [(entry, True) for entry in (*added, *changed)] + [(entry, False) for entry in removed]
+            for entry, kept in present:
+                old = self.keys.get(entry.id)
+                new = waypoint_key(entry) if kept else None
+                # Waymarks outside the file's dimension, or clashing with another synced waypoint, stay Waymark-only
+                if new and (entry.dimension not in self.dimensions or self.links.get(new, entry.id) != entry.id): new = None
+                if old == new: continue
+                if old: self.forget(old)
+                if new: self.remember(new, entry.id)
+                if old and new: replaces[old] = entry
+                elif old: drops.add(old)
+                elif new: adds.append(entry)
+            if not (adds or replaces or drops): return
+            # Our own write must not look like an in-game change, unless the mod also wrote since the last sync
+            unseen = self.changed()
+            if self.fmt == "xaero": self.write_xaero(adds, replaces, drops)
+            else: self.write_journeymap(adds, replaces, drops)
+            if not unseen: self.fingerprint = self.stat()
+            self.save()
+
+    def write_xaero(self, adds, replaces, drops):
+        with open(self.path, "r", encoding="utf-8") as f: lines = f.readlines()
+        out = []
+        for line in lines:
+            record = xaero_waypoint(line, self.dimensions[0]) if line.startswith("waypoint:") else None
+            key = waypoint_key(record) if record else None
+            if key in drops: drops.discard(key)
+            elif key in replaces: out.append(xaero_line(replaces.pop(key), line))
+            else: out.append(line)
+        if out and not out[-1].endswith("\n"): out[-1] += "\n"
+        # Edits whose line the mod removed meanwhile are written as new waypoints
+        out += [xaero_line(entry) for entry in [*replaces.values(), *adds]]
+        tmp = self.path + ".waymark.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.writelines(out)
+        os.replace(tmp, self.path)
+
+    def write_journeymap(self, adds, replaces, drops):
+        if any(key not in self.files for key in [*replaces, *drops]): self.read()
+        writes = [(entry, None) for entry in adds]
+        for key in drops:
+            if key in self.files: os.remove(os.path.join(self.path, self.files.pop(key)))
+        for key, entry in replaces.items():
+            base = {}
+            if key in self.files:
+                old = os.path.join(self.path, self.files.pop(key))
+                try:
+                    with open(old, "r", encoding="utf-8") as f: base = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                os.remove(old)
+            writes.append((entry, base))
+        for entry, base in writes:
+            data = journeymap_data(entry, base)
+            with open(os.path.join(self.path, journeymap_file(data)), "w", encoding="utf-8") as f: json.dump(data, f)
+            self.files[waypoint_key(entry)] = journeymap_file(data)
@@ -1,45 +1,96 @@
 import flet as ft
-import json
+import asyncio
 import os
-from datetime import datetime
-import shutil
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from waymark_core import (
+    LEGACY_TIME_FORMAT, Dimension, ImageStore, InvalidWaymark, Waymark, World, backfill_thumbnails, card_image_src,
+    format_coordinate, linked_coordinates, load_session, make_thumbnail, open_world_store, parse_coordinate, parse_radius,
+    save_session, teleport_command,
+)
+from waymark_bundle import BUNDLE_EXTENSION, export_bundle, forget_base, import_bundle
+from waymark_formats import EXPORT_EXTENSIONS, export_waymarks, read_waypoint_file
+from waymark_merge import plan_merge
+from waymark_sync import WaypointSync, unlink_world
 
 # --- GLOBAL CONFIGURATION ---
-# This finds the user's "AppData/Roaming" folder automatically
-APP_DATA_ROOT = os.path.join(os.environ.get("APPDATA"), "WaymarkApp")
-STORAGE_DIR = os.path.join(APP_DATA_ROOT, "waymark_data")
-IMAGE_DIR = os.path.join(STORAGE_DIR, "images")
-
-# Create the folders in the user's home directory instead of Program Files
-for d in [APP_DATA_ROOT, STORAGE_DIR, IMAGE_DIR]:
-    if not os.path.exists(d):
-        try:
-            os.makedirs(d)
-        except PermissionError:
-            # Fallback for extreme cases: save to the current directory
-            # (only happens if AppData is somehow locked)
-            pass
+# Storage paths and engine settings live in waymark_core
+# Registry virtualization: only a window of cards around the viewport is materialized
+REGISTRY_WINDOW = 30      # Cards built at once
+REGISTRY_OVERSCAN = 10    # Cards kept above the first visible one
+CARD_EXTENT = 145         # Estimated card height plus list spacing, in pixels
+WORLD_CACHE_ENTRIES = 250_000 # Waymarks kept in memory across recently used worlds besides the open one
+SEARCH_DEBOUNCE = 0.2     # Seconds of typing quiet before a search runs
+IMAGE_WORKERS = 2             # Threads copying, hashing and thumbnailing attached screenshots
+IMAGE_GC_DELAY = 60           # Seconds after startup before the first sweep for unused screenshots
+IMAGE_GC_INTERVAL = 6 * 3600  # Seconds between sweeps
+MINIMAP_POLL_INTERVAL = 1.0   # Seconds between checks of a linked minimap waypoint file
+
+class WaymarkCard(ft.Card):
+    """
+    Registry card. Cards never change after they are built (edits swap in a new
+    card), so Flet's diff can skip their subtree on every page update.
+    """
+    def is_isolated(self):
+        return True
 
 class WaymarkApp:
     """
     A comprehensive Minecraft Coordinate Tracker designed for high-legibility
     and responsive use across different monitor orientations.
     """
+    # Per-world state parked in self.world_cache while another world is open
+    WORLD_STATE = ("world", "card_index", "registry_rows", "window_start")
+
     def __init__(self, page: ft.Page):
         self.page = page
-        self.current_world = ""
         self.selected_image_path = None
         self.edit_image_path = None 
-        self.all_data = [] # Local cache of the current world's JSON content
+        self.world = None # The open waymark_core.World: records newest first plus their indexes
+        self.card_index = {} # Entry ID -> built card, only for entries inside the render window
+        self.search_future = None # Pending debounced query, cancelled by the next keystroke
+        self.registry_rows = [] # Entries matching the search, in display order
+        self.window_start = 0
+        self.scroll_offset = 0 # Registry scroll position in pixels, remembered across restarts
+        self.session = load_session()
+        self.world_ready = threading.Event() # Cleared while a world finishes loading behind its first paint
+        self.world_ready.set()
+        self.world_cache = OrderedDict() # World name -> parked state of a recently used world, oldest first
+        self.store = open_world_store()
+        self.images = ImageStore(self.store)
+        self.images.load_refs() # Recounted once from every world if refs.json doesn't exist yet
+        self.image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="waymark-image")
+        self.pending_images = {} # Entry ID -> token of the ingestion that will attach its screenshot
+        # Image workers and the minimap watcher change the open World off the UI thread, so every read or write of
+        # self.world, its records and indexes, and pending_images holds this lock
+        self.world_lock = threading.RLock()
+        self.minimap_sync = None # WaypointSync of the open world, if it's linked to a minimap
+        self.sync_world = None   # Name of the world minimap_sync was opened for
 
         # Initialize FilePickers - Must be added to page.overlay for Flet 0.28.3
         self.file_picker = ft.FilePicker(on_result=self.handle_file_picker_result)
         self.edit_file_picker = ft.FilePicker(on_result=self.handle_edit_picker_result)
-        self.page.overlay.extend([self.file_picker, self.edit_file_picker])
+        self.import_picker = ft.FilePicker(on_result=self.handle_import_picker_result)
+        self.export_picker = ft.FilePicker(on_result=self.handle_export_picker_result)
+        self.sync_picker = ft.FilePicker(on_result=self.handle_sync_picker_result)
+        self.share_picker = ft.FilePicker(on_result=self.handle_share_picker_result)
+        self.bundle_picker = ft.FilePicker(on_result=self.handle_bundle_picker_result)
+        self.merge_picker = ft.FilePicker(on_result=self.handle_merge_picker_result)
+        self.page.overlay.extend([self.file_picker, self.edit_file_picker, self.import_picker, self.export_picker, self.sync_picker,
+                                  self.share_picker, self.bundle_picker, self.merge_picker])
         
         self.configure_page()
         self.build_interface()
-        self.init_world_data()
+        self.init_world_data(restore=True)
+        threading.Thread(target=self.reconcile_worlds, daemon=True).start()
+        threading.Thread(target=self.backfill_card_thumbnails, daemon=True).start()
+        threading.Thread(target=self.collect_unused_images, daemon=True).start()
+        threading.Thread(target=self.watch_minimap, daemon=True).start()
 
     def configure_page(self):
         """Initializes window dimensions and theme settings."""
@@ -64,6 +115,7 @@ class WaymarkApp:
         self.ui_seed_field = ft.TextField(label="Seed", read_only=True, expand=True, text_size=12)
         self.ui_seed_lock = ft.IconButton(ft.Icons.LOCK_OUTLINE, on_click=self.toggle_seed_security, icon_color=self.COLOR_ACCENT)
         self.ui_new_world_field = ft.TextField(label="New World Name", visible=False, on_submit=self.execute_world_creation)
+        self.ui_sync_btn = ft.TextButton("Link Minimap File", icon=ft.Icons.SYNC, on_click=self.toggle_minimap_sync)
         
         self.ui_dim_toggle = ft.RadioGroup(
             content=ft.Row([
@@ -98,6 +150,17 @@ class WaymarkApp:
             ft.Row([self.ui_world_drop, ft.IconButton(ft.Icons.ADD_CIRCLE, on_click=self.show_new_world_field), ft.IconButton(ft.Icons.DELETE_FOREVER, icon_color="red400", on_click=self.show_delete_world_dialog)]),
             self.ui_new_world_field,
             ft.Row([self.ui_seed_field, self.ui_seed_lock]),
+            ft.TextButton("Import Minimap Waypoints", icon=ft.Icons.DOWNLOAD, on_click=lambda _: self.import_picker.pick_files(
+                dialog_title="Xaero .txt, VoxelMap .points or JourneyMap .json", allow_multiple=True, allowed_extensions=["txt", "points", "json"])),
+            self.ui_sync_btn,
+            ft.Row([
+                ft.TextButton("Share World", icon=ft.Icons.SHARE, on_click=lambda _: self.share_picker.save_file(
+                    dialog_title="Save world bundle", file_name=self.world.name + BUNDLE_EXTENSION, allowed_extensions=[BUNDLE_EXTENSION[1:]])),
+                ft.TextButton("Open Shared World", icon=ft.Icons.FOLDER_OPEN, on_click=lambda _: self.bundle_picker.pick_files(
+                    dialog_title="Waymark world bundle", allowed_extensions=[BUNDLE_EXTENSION[1:]])),
+                ft.TextButton("Merge Friend's Copy", icon=ft.Icons.MERGE_TYPE, on_click=lambda _: self.merge_picker.pick_files(
+                    dialog_title="Their bundle of this world", allowed_extensions=[BUNDLE_EXTENSION[1:]])),
+            ], wrap=True),
             ft.Divider(height=20, color="transparent"),
             ft.Text("DIMENSION", size=11, weight="bold", color="grey500"),
             self.ui_dim_toggle,
@@ -121,11 +184,18 @@ class WaymarkApp:
 
         # --- REGISTRY VIEW ---
         self.ui_search = ft.TextField(hint_text="Search logs...", prefix_icon=ft.Icons.SEARCH, on_change=self.apply_search_filter, expand=True)
-        self.ui_registry = ft.ListView(expand=True, spacing=15, padding=20)
+        self.ui_radius_in = ft.TextField(label="Radius", width=100, on_submit=self.apply_near_filter)
+        self.ui_near_btn = ft.IconButton(ft.Icons.NEAR_ME, tooltip="Nearest to sidebar X/Z", on_click=self.apply_near_filter, icon_color=self.COLOR_ACCENT)
+        self.ui_export_btn = ft.IconButton(ft.Icons.UPLOAD_FILE, tooltip="Export shown waymarks (.csv, .geojson, VoxelMap .points)", icon_color=self.COLOR_ACCENT,
+                                           on_click=lambda _: self.export_picker.save_file(file_name=f"{self.world.name}.csv", allowed_extensions=["csv", "geojson", "points"]))
+        self.ui_registry = ft.ListView(expand=True, spacing=15, padding=20, on_scroll=self.on_registry_scroll, on_scroll_interval=50)
+        # Spacers stand in for the cards outside the render window so the scrollbar keeps its true size
+        self.ui_top_spacer = ft.Container(height=0, visible=False)
+        self.ui_bottom_spacer = ft.Container(height=0, visible=False)
 
         main_registry_panel = ft.Container(
             content=ft.Column([
-                ft.Row([ft.Text("COORDINATE REGISTRY", size=24, weight="bold"), self.ui_search], alignment="spaceBetween"),
+                ft.Row([ft.Text("COORDINATE REGISTRY", size=24, weight="bold"), self.ui_search, self.ui_radius_in, self.ui_near_btn, self.ui_export_btn], alignment="spaceBetween"),
                 ft.Divider(color=self.COLOR_ACCENT),
                 self.ui_registry
             ]),
@@ -135,48 +205,198 @@ class WaymarkApp:
         self.page.add(ft.Row([sidebar_panel, main_registry_panel], expand=True, spacing=0))
 
     # --- CORE LOGIC: DATA HANDLING ---
-    def init_world_data(self):
-        """Loads available worlds from storage on startup."""
-        files = sorted([f.replace(".json", "") for f in os.listdir(STORAGE_DIR) if f.endswith(".json")])
+    def init_world_data(self, restore=False):
+        """Loads available worlds from the store's catalog; on startup, reopens the last session's world."""
+        files = self.refresh_world_picker()
         if not files:
-            files = ["My_First_World"]
-            with open(os.path.join(STORAGE_DIR, "My_First_World.json"), "w") as f: json.dump([], f)
-        
-        self.ui_world_drop.options = [ft.dropdown.Option(f) for f in files]
-        self.ui_world_drop.value = files[0]
-        self.current_world = files[0]
-        self.sync_registry_from_file()
-
-    def sync_registry_from_file(self):
-        """Reads JSON data for current world and populates UI."""
-        self.ui_registry.controls.clear()
-        self.ui_seed_field.value = ""
-        path = os.path.join(STORAGE_DIR, f"{self.current_world}.json")
-        
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                try: self.all_data = json.load(f)
-                except: self.all_data = []
-        
-        # Load World Metadata (Seed) vs Waymark Entries
-        for entry in self.all_data:
-            if entry.get("type") == "world_meta":
-                self.ui_seed_field.value = entry.get("seed", "")
+            self.store.create_world("My_First_World")
+            files = self.refresh_world_picker()
+
+        if restore:
+            world = self.session.get("world") if self.session.get("world") in files else files[0]
+            self.ui_world_drop.value = world
+            self.ui_search.value = self.session.get("search", "")
+            self.first_paint(world, self.session.get("scroll", 0) if world == self.session.get("world") else 0)
+        else:
+            self.ui_world_drop.value = files[0]
+            self.open_world(files[0])
+
+    def first_paint(self, name, scroll):
+        """
+        Startup path: paints the remembered viewport from the newest few records, then loads the whole
+        world and its indexes on a background thread, so time-to-interactive doesn't grow with the world.
+        """
+        self.world_ready.clear()
+        self.scroll_offset = scroll
+        term = self.ui_search.value or ""
+        self.window_start = 0 if term else max(0, int(scroll // CARD_EXTENT) - REGISTRY_OVERSCAN)
+        with self.world_lock: self.world = World.load(self.store, name, self.window_start + REGISTRY_WINDOW)
+        self.ui_seed_field.value = self.world.seed
+        # A search can only be answered once every record is indexed; until then show the matches at hand
+        self.registry_rows = [e for e in self.world.entries if self.matches_search(e)] if term else list(self.world.entries)
+        self.render_window()
+        if not term:
+            total = next((w["entries"] for w in self.store.catalog() if w["name"] == name), len(self.world))
+            hidden_below = max(0, total - self.window_start - REGISTRY_WINDOW)
+            self.ui_bottom_spacer.height, self.ui_bottom_spacer.visible = hidden_below * CARD_EXTENT, hidden_below > 0
+        if self.ui_registry.page: self.ui_registry.scroll_to(offset=scroll)
+        self.page.update()
+        threading.Thread(target=self.finish_loading, args=(name,), daemon=True).start()
+
+    def finish_loading(self, name):
+        """Background half of first_paint: swaps in the full world without moving the viewport."""
+        try:
+            entries, seed = self.store.load_world(name)
+            with self.world_lock:
+                # Keep the records the first paint handed out, so open dialogs and built cards stay bound to them
+                head = self.world.index
+                self.world = World(self.store, name, [head.get(e.id, e) for e in entries], seed)
+                self.registry_rows = self.world.search(self.ui_search.value or "")
+            self.render_window()
+            self.page.update()
+        finally:
+            self.world_ready.set()
+
+    def remember_session(self):
+        self.session = {"world": self.world.name, "search": self.ui_search.value or "", "scroll": self.scroll_offset}
+        try: save_session(self.session)
+        except OSError: pass # Losing the remembered position is harmless
+
+    def refresh_world_picker(self):
+        """Rebuilds the world dropdown from the catalog (no world is opened) and returns the world names."""
+        worlds = self.store.catalog()
+        self.ui_world_drop.options = [
+            ft.dropdown.Option(key=w["name"], text=f"{w['name']}  ·  {w['entries']} waymark{'s' if w['entries'] != 1 else ''}")
+            for w in worlds]
+        return [w["name"] for w in worlds]
+
+    def reconcile_worlds(self):
+        """Background check for world files changed outside the app; refreshes the picker if any were."""
+        self.world_ready.wait()
+        if self.store.reconcile_catalog():
+            names = self.refresh_world_picker()
+            self.world_cache.clear()
+            if self.world.name in names:
+                self.sync_registry_from_file(self.world.name)
             else:
-                self.ui_registry.controls.append(self.build_waymark_card(entry))
+                self.init_world_data()
+            self.page.update()
+
+    def open_world(self, name):
+        """Switches the registry to `name`, reusing its parsed records, indexes and cards if it was open recently."""
+        self.world_ready.wait()
+        term = self.ui_search.value or ""
+        with self.world_lock:
+            if self.world is not None and self.world.name != name: self.park_world()
+            state = self.world_cache.pop(name, None)
+            if state is not None:
+                for key in self.WORLD_STATE: setattr(self, key, state[key])
+                if term != state["term"]: self.registry_rows, self.window_start = self.world.search(term), 0
+        if state is None:
+            self.sync_registry_from_file(name)
+            self.remember_session()
+            return
+        self.ui_seed_field.value = self.world.seed
+        self.render_window()
+        self.scroll_offset = self.window_start * CARD_EXTENT
+        if self.ui_registry.page: self.ui_registry.scroll_to(offset=self.scroll_offset)
+        self.page.update()
+        self.remember_session()
+
+    def park_world(self):
+        """Moves the open world's state into the LRU, evicting the least recently used worlds past WORLD_CACHE_ENTRIES."""
+        state = {key: getattr(self, key) for key in self.WORLD_STATE}
+        state["term"] = self.ui_search.value or ""
+        self.world_cache[self.world.name] = state
+        total = sum(max(1, len(s["world"])) for s in self.world_cache.values())
+        while total > WORLD_CACHE_ENTRIES and self.world_cache:
+            name, evicted = self.world_cache.popitem(last=False)
+            total -= max(1, len(evicted["world"]))
+            self.store.unload(name) # The journal engine keeps its own copy of every world it has read
+
+    def sync_registry_from_file(self, name=None):
+        """Reads a world (by default the open one) from the store and populates UI."""
+        self.world_ready.wait()
+        with self.world_lock:
+            self.world = World.load(self.store, name or self.world.name)
+            rows = self.world.search(self.ui_search.value or "")
+        self.ui_seed_field.value = self.world.seed
+        self.card_index = {}
+        self.show_rows(rows)
         self.page.update()
 
+    # --- CORE LOGIC: VIRTUALIZED REGISTRY ---
+    # self.registry_rows holds every matching entry, but only REGISTRY_WINDOW of
+    # them have cards at any time. Mutations patch the rows and re-render the
+    # window; nothing is re-read from disk.
+    def matches_search(self, entry):
+        return (self.ui_search.value or "").lower() in entry.desc.lower()
+
+    def card_for(self, entry):
+        """Returns the entry's card, building it only when it enters the render window."""
+        card = self.card_index.get(entry.id)
+        if card is None: card = self.card_index[entry.id] = self.build_waymark_card(entry)
+        return card
+
+    def show_rows(self, rows):
+        """Replaces the registry contents and jumps back to the top."""
+        self.registry_rows = rows
+        self.window_start = self.scroll_offset = 0
+        self.render_window()
+        if self.ui_registry.page: self.ui_registry.scroll_to(offset=0)
+
+    def render_window(self):
+        """Materializes the cards inside the window and recycles the ones that left it."""
+        rows = self.registry_rows
+        self.window_start = max(0, min(self.window_start, len(rows) - REGISTRY_WINDOW))
+        window = rows[self.window_start:self.window_start + REGISTRY_WINDOW]
+        cards = [self.card_for(entry) for entry in window]
+        visible_ids = {entry.id for entry in window}
+        for entry_id in [i for i in self.card_index if i not in visible_ids]: del self.card_index[entry_id]
+
+        hidden_below = len(rows) - self.window_start - len(window)
+        self.ui_top_spacer.height = self.window_start * CARD_EXTENT
+        self.ui_top_spacer.visible = self.window_start > 0
+        self.ui_bottom_spacer.height = hidden_below * CARD_EXTENT
+        self.ui_bottom_spacer.visible = hidden_below > 0
+        self.ui_registry.controls = [self.ui_top_spacer, *cards, self.ui_bottom_spacer]
+
+    def on_registry_scroll(self, e):
+        self.scroll_offset = e.pixels
+        start = max(0, int(e.pixels // CARD_EXTENT) - REGISTRY_OVERSCAN)
+        # Only shift once the viewport has drifted far enough to matter
+        if abs(start - self.window_start) >= REGISTRY_OVERSCAN // 2:
+            self.window_start = start
+            self.render_window()
+            self.page.update()
+            self.remember_session()
+
+    def show_added_entry(self, entry):
+        if self.matches_search(entry):
+            self.registry_rows.insert(0, entry)
+            # Keep the viewport on the same cards when the new one lands above it
+            if self.window_start: self.window_start += 1
+            self.render_window()
+
+    def show_changed_entry(self, entry):
+        self.card_index.pop(entry.id, None)
+        if not self.matches_search(entry) and entry in self.registry_rows: self.registry_rows.remove(entry)
+        self.render_window()
+
+    def show_removed_entry(self, entry):
+        self.card_index.pop(entry.id, None)
+        if entry in self.registry_rows: self.registry_rows.remove(entry)
+        self.render_window()
+
     def build_waymark_card(self, entry):
         """Constructs a responsive card for a coordinate entry."""
-        try:
-            x, y, z = float(entry['x']), float(entry['y']), float(entry['z'])
-            dim = entry.get("dimension", "overworld")
-            card_color = self.COLOR_OVERWORLD if dim == "overworld" else self.COLOR_NETHER
-            
-            # Dimension Linking Logic
-            label = "Nether Link (÷8)" if dim == "overworld" else "Overworld Link (×8)"
-            cx, cz = (f"{(x/8):.2f}", f"{(z/8):.2f}") if dim == "overworld" else (f"{(x*8):.2f}", f"{(z*8):.2f}")
-        except: x = y = z = 0; card_color = self.COLOR_SIDEBAR; label="Math Error"; cx = cz = "0"
+        x, y, z = entry.x, entry.y, entry.z
+        overworld = entry.dimension is Dimension.OVERWORLD
+        card_color = self.COLOR_OVERWORLD if overworld else self.COLOR_NETHER
+
+        # Dimension Linking Logic
+        label = "Nether Link (÷8)" if overworld else "Overworld Link (×8)"
+        cx, cz = (f"{c:.2f}" for c in linked_coordinates(entry))
 
         # Responsive Wrap Row for coordinates
         coord_layout = ft.Row(
@@ -188,10 +408,13 @@ class WaymarkApp:
             ]
         )
 
-        img_path = entry.get("image", "")
-        img_widget = ft.Image(src=img_path, width=120, height=80, border_radius=8, fit=ft.ImageFit.COVER) if img_path and os.path.exists(img_path) else ft.Icon(ft.Icons.IMAGE_NOT_SUPPORTED, size=40)
+        img_path = entry.image
+        if entry.id in self.pending_images:
+            img_widget = ft.Container(ft.ProgressRing(width=24, height=24, stroke_width=3), width=120, height=80, alignment=ft.alignment.center, tooltip="Saving screenshot...")
+        else:
+            img_widget = ft.Image(src=card_image_src(img_path), width=120, height=80, border_radius=8, fit=ft.ImageFit.COVER) if img_path and os.path.exists(img_path) else ft.Icon(ft.Icons.IMAGE_NOT_SUPPORTED, size=40)
 
-        return ft.Card(
+        return WaymarkCard(
             color=card_color,
             content=ft.Container(
                 padding=15,
@@ -199,16 +422,16 @@ class WaymarkApp:
                     ft.Row([
                         ft.Container(img_widget, on_click=lambda _: self.preview_image(img_path)),
                         ft.Column([
-                            ft.Text(entry['desc'], size=18, weight="bold"),
+                            ft.Text(entry.desc, size=18, weight="bold"),
                             coord_layout,
                             ft.Text(f"{label}: X {cx} / Z {cz}", size=14, italic=True, color="orange300", weight="bold"),
                         ], expand=True),
                         ft.Column([
-                            ft.Text(entry['created'], size=10, color="grey400"),
+                            ft.Text(entry.created.strftime(LEGACY_TIME_FORMAT), size=10, color="grey400"),
                             ft.Row([
-                                ft.IconButton(ft.Icons.LOCATION_ON, tooltip="Copy /tp Command", on_click=lambda _: self.page.set_clipboard(f"/tp {x:.2f} {y:.2f} {z:.2f}")),
-                                ft.IconButton(ft.Icons.EDIT, on_click=lambda _: self.show_edit_dialog(entry)),
-                                ft.IconButton(ft.Icons.DELETE, icon_color="red400", on_click=lambda _: self.prompt_delete_entry(entry)),
+                                ft.IconButton(ft.Icons.LOCATION_ON, tooltip="Copy /tp Command", on_click=lambda _: self.page.set_clipboard(teleport_command(entry))),
+                                ft.IconButton(ft.Icons.EDIT, on_click=lambda _: self.show_edit_dialog(entry.id)),
+                                ft.IconButton(ft.Icons.DELETE, icon_color="red400", on_click=lambda _: self.prompt_delete_entry(entry.id)),
                             ], spacing=0)
                         ], horizontal_alignment="end")
                     ])
@@ -217,18 +440,25 @@ class WaymarkApp:
         )
 
     # --- LOGIC: USER ACTIONS ---
-    def prompt_delete_entry(self, entry):
+    def prompt_delete_entry(self, entry_id):
         """Double-check confirmation dialog before deleting an entry."""
+        entry = self.world.get(entry_id)
         def finalize_delete(ev):
-            self.all_data.remove(entry)
-            self.save_registry_to_file()
-            self.sync_registry_from_file()
+            self.world_ready.wait()
+            with self.world_lock:
+                # Dropped first, so a screenshot worker finishing meanwhile can't attach to the deleted entry
+                self.pending_images.pop(entry_id, None)
+                self.world.remove(entry_id)
+            self.push_to_minimap(removed=[entry])
+            self.images.release(entry.image)
+            self.show_removed_entry(entry)
+            self.refresh_world_picker()
             dlg.open = False
             self.page.update()
 
         dlg = ft.AlertDialog(
             title=ft.Text("Delete Waymark?"),
-            content=ft.Text(f"Are you sure you want to delete '{entry['desc']}'? This cannot be undone."),
+            content=ft.Text(f"Are you sure you want to delete '{entry.desc}'? This cannot be undone."),
             actions=[
                 ft.TextButton("Cancel", on_click=lambda _: setattr(dlg, 'open', False) or self.page.update()),
                 ft.ElevatedButton("Delete", bgcolor="red400", color="white", on_click=finalize_delete)
@@ -240,48 +470,48 @@ class WaymarkApp:
 
     def process_new_entry(self, e):
         """Validates and saves a new coordinate entry."""
-        if not self.ui_desc_in.value: return
-        
-        stored_img = ""
-        if self.selected_image_path:
-            name = f"img_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-            stored_img = os.path.join(IMAGE_DIR, name)
-            shutil.copy(self.selected_image_path, stored_img)
-            
-        now = datetime.now().strftime("%m/%d %H:%M")
-        new_log = {
-            "desc": self.ui_desc_in.value, 
-            "x": self.ui_x_in.value or "0", "y": self.ui_y_in.value or "0", "z": self.ui_z_in.value or "0",
-            "dimension": self.ui_dim_toggle.value,
-            "created": now, "modified": now, "image": stored_img
-        }
-        
-        self.all_data.insert(0, new_log)
-        self.save_registry_to_file()
-        self.sync_registry_from_file()
+        self.world_ready.wait() # A save during startup lands after the full world has loaded
+        fields = {"desc": self.ui_desc_in, "x": self.ui_x_in, "y": self.ui_y_in, "z": self.ui_z_in}
+        try:
+            new_log = Waymark.from_input(self.ui_desc_in.value, self.ui_x_in.value, self.ui_y_in.value, self.ui_z_in.value, self.ui_dim_toggle.value)
+        except InvalidWaymark as err:
+            self.show_input_error(fields, err)
+            return
+
+        with self.world_lock: self.world.add(new_log)
+        self.push_to_minimap(added=[new_log])
+        # Queued only once the record exists, so the worker can always find it
+        if self.selected_image_path: self.queue_image(new_log, self.selected_image_path)
+        self.show_added_entry(new_log)
+        self.refresh_world_picker()
         self.reset_form(None)
 
-    def show_edit_dialog(self, entry):
+    def show_edit_dialog(self, entry_id):
         """Modular edit window for existing entries."""
         self.edit_image_path = None
-        e_desc = ft.TextField(label="Description", value=entry['desc'], expand=True)
-        e_x = ft.TextField(label="X", value=entry['x'], expand=True)
-        e_y = ft.TextField(label="Y", value=entry['y'], expand=True)
-        e_z = ft.TextField(label="Z", value=entry['z'], expand=True)
-        e_dim = ft.RadioGroup(content=ft.Row([ft.Radio(value="overworld", label="Overworld"), ft.Radio(value="nether", label="Nether")]), value=entry.get("dimension", "overworld"))
+        entry = self.world.get(entry_id)
+        e_desc = ft.TextField(label="Description", value=entry.desc, expand=True)
+        e_x = ft.TextField(label="X", value=format_coordinate(entry.x), expand=True)
+        e_y = ft.TextField(label="Y", value=format_coordinate(entry.y), expand=True)
+        e_z = ft.TextField(label="Z", value=format_coordinate(entry.z), expand=True)
+        e_dim = ft.RadioGroup(content=ft.Row([ft.Radio(value="overworld", label="Overworld"), ft.Radio(value="nether", label="Nether")]), value=entry.dimension.value)
 
         def commit_changes(ev):
-            final_img = entry.get("image", "")
-            if self.edit_image_path:
-                name = f"img_edit_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-                final_img = os.path.join(IMAGE_DIR, name)
-                shutil.copy(self.edit_image_path, final_img)
-            
-            entry.update({
-                "desc": e_desc.value, "x": e_x.value, "y": e_y.value, "z": e_z.value,
-                "dimension": e_dim.value, "modified": datetime.now().strftime("%m/%d %H:%M"), "image": final_img
-            })
-            self.save_registry_to_file(); self.sync_registry_from_file(); dlg.open = False; self.page.update()
+            self.world_ready.wait()
+            try:
+                edited = Waymark.from_input(e_desc.value, e_x.value, e_y.value, e_z.value, e_dim.value)
+            except InvalidWaymark as err:
+                self.show_input_error({"desc": e_desc, "x": e_x, "y": e_y, "z": e_z}, err)
+                return
+
+            # A swapped screenshot is ingested in the background; the old one stays until it's ready
+            if self.edit_image_path: self.queue_image(entry, self.edit_image_path)
+            with self.world_lock:
+                entry.desc, entry.x, entry.y, entry.z = edited.desc, edited.x, edited.y, edited.z
+                entry.dimension, entry.modified = edited.dimension, edited.created
+                self.world.update(entry)
+            self.push_to_minimap(changed=[entry])
+            self.show_changed_entry(entry); dlg.open = False; self.page.update()
 
         dlg = ft.AlertDialog(
             title=ft.Text("Update Waymark"),
@@ -290,10 +520,215 @@ class WaymarkApp:
         )
         self.page.overlay.append(dlg); dlg.open = True; self.page.update()
 
+    # --- IMAGE INGESTION ---
+    def queue_image(self, entry, source):
+        """Hands a screenshot to the worker pool; the entry's card shows a placeholder until it's attached."""
+        token = object() # A later swap for the same entry supersedes this one
+        with self.world_lock:
+            self.pending_images[entry.id] = token
+            world = self.world.name
+        self.image_pool.submit(self.ingest_image, world, entry.id, source, token)
+
+    def ingest_image(self, world, entry_id, source, token):
+        """Worker: copies, hashes and thumbnails the screenshot, then attaches it unless the entry moved on meanwhile."""
+        try:
+            stored = self.images.put(source)
+            make_thumbnail(stored)
+        except OSError:
+            stored = "" # Unreadable source: just drop the placeholder
+        with self.world_lock:
+            if self.pending_images.get(entry_id) is not token: return
+            del self.pending_images[entry_id]
+            current, parked = world == self.world.name, self.world_cache.get(world)
+            if current or parked:
+                target = self.world if current else parked["world"]
+                entry = target.get(entry_id)
+                if parked: parked["card_index"].pop(entry_id, None) # Rebuilt without the placeholder when the world is reopened
+            else:
+                target = None
+                entry = next((e for e in self.store.load_world(world)[0] if e.id == entry_id), None)
+            if entry is None: return
+            if stored and stored != entry.image:
+                self.images.retain(stored)
+                self.images.release(entry.image)
+                entry.image = stored
+                if target: target.update(entry)
+                else: self.store.update_entry(world, entry)
+        if current:
+            self.show_changed_entry(entry)
+            self.page.update()
+
+    # --- MINIMAP SYNC ---
+    # The open world can be linked to a Xaero waypoint file or JourneyMap folder.
+    # Changes made in-game are polled for and merged in; changes made here are
+    # written straight back. Both sides only touch the records that changed.
+    def current_sync(self):
+        """Returns the open world's WaypointSync (or None), reopening it when another world is opened."""
+        if self.sync_world != self.world.name:
+            self.sync_world, self.minimap_sync = self.world.name, WaypointSync.open(self.world)
+            self.show_sync_state()
+        elif self.minimap_sync:
+            self.minimap_sync.world = self.world # Reloads replace the World object
+        return self.minimap_sync
+
+    def show_sync_state(self):
+        sync = self.minimap_sync
+        self.ui_sync_btn.text = f"Unlink {os.path.basename(sync.path)}" if sync else "Link Minimap File"
+        self.ui_sync_btn.icon = ft.Icons.SYNC_DISABLED if sync else ft.Icons.SYNC
+
+    def toggle_minimap_sync(self, e):
+        if self.current_sync():
+            unlink_world(self.world.name)
+            self.minimap_sync = None
+            self.show_sync_state(); self.page.update()
+        else:
+            self.sync_picker.pick_files(dialog_title="Xaero waypoint .txt, or any waypoint .json in a JourneyMap folder", allowed_extensions=["txt", "json"])
+
+    def handle_sync_picker_result(self, e):
+        if not e.files: return
+        self.world_ready.wait()
+        try:
+            with self.world_lock: sync, changes = WaypointSync.link(self.world, e.files[0].path)
+            message = f"Syncing with {os.path.basename(sync.path)}: {len(changes[0])} waypoint(s) added from the minimap"
+        except (OSError, ValueError) as err:
+            sync, message = None, f"Couldn't link the minimap file: {err}"
+        if sync:
+            self.sync_world, self.minimap_sync = self.world.name, sync
+            self.show_sync_state()
+            self.show_sync_changes(*changes)
+        self.show_message(message)
+
+    def push_to_minimap(self, added=(), changed=(), removed=()):
+        with self.world_lock:
+            sync = self.current_sync()
+            if not sync: return
+            try: sync.push(added, changed, removed)
+            except OSError: pass # The mod's file is missing or locked; the waymark itself is saved either way
+
+    def watch_minimap(self):
+        """Background loop: merges waypoints added, edited or deleted in-game into the open world."""
+        while True:
+            time.sleep(MINIMAP_POLL_INTERVAL)
+            self.world_ready.wait()
+            # Whatever goes wrong in one poll, the next one still runs; the loop is the only thing watching the file
+            try: self.poll_minimap()
+            except Exception: traceback.print_exc()
+
+    def poll_minimap(self):
+        with self.world_lock:
+            if self.world is None: return
+            sync = self.current_sync()
+            if not (sync and sync.changed()): return
+            try: changes = sync.pull()
+            except (OSError, ValueError): return # Caught mid-write by the mod; the next poll retries
+        self.show_sync_changes(*changes)
+        self.page.update()
+
+    def show_sync_changes(self, added, changed, removed):
+        for entry in added: self.show_added_entry(entry)
+        for entry in changed: self.show_changed_entry(entry)
+        for entry in removed:
+            with self.world_lock: self.pending_images.pop(entry.id, None)
+            self.images.release(entry.image)
+            self.show_removed_entry(entry)
+        if added or removed: self.refresh_world_picker()
+
+    # --- MERGE ---
+    def handle_merge_picker_result(self, e):
+        """Merges a friend's bundle of the open world into it; conflicts and deletions are reviewed first, anything else applies at once."""
+        if not e.files: return
+        self.world_ready.wait()
+        try:
+            with self.world_lock: plan = plan_merge(self.world, e.files[0].path)
+        except (OSError, ValueError, sqlite3.Error) as err:
+            self.show_message(f"Couldn't merge: {err}")
+            return
+        if plan.conflicts or plan.removed: self.show_merge_review(plan)
+        else: self.apply_merge(plan)
+
+    def describe_version(self, entry):
+        if entry is None: return "deleted"
+        coords = " / ".join(format_coordinate(v) for v in (entry.x, entry.y, entry.z))
+        return f"{entry.desc}  ·  {coords} {entry.dimension.value}  ·  {entry.modified.strftime(LEGACY_TIME_FORMAT)}"
+
+    def show_merge_review(self, plan):
+        """
+        Lists the waymarks both copies changed, one switch each to take their version (the newer edit starts
+        selected), then the ones their copy deleted, which go if the merge is confirmed.
+        """
+        switches = [ft.Switch(value=plan.newer(conflict)) for conflict in plan.conflicts]
+        rows = [ft.Row([
+                    ft.Column([ft.Text(f"Yours: {self.describe_version(ours)}", size=12),
+                               ft.Text(f"Theirs: {self.describe_version(theirs)}", size=12, color="grey400")], spacing=2, expand=True),
+                    ft.Text("Take theirs", size=11, color="grey500"), switch,
+                ]) for (ours, theirs), switch in zip(plan.conflicts, switches)]
+        if plan.removed:
+            rows.append(ft.Text(f"Deleted in their copy ({len(plan.removed)})", size=12, weight=ft.FontWeight.BOLD))
+            rows += [ft.Text(self.describe_version(entry), size=12, color="grey400") for entry in plan.removed]
+        others = len(plan) - len(plan.conflicts) - len(plan.removed)
+        intro = ("" if not plan.conflicts else "Both copies changed the conflicts since the world was last shared. " if plan.base else
+                 "The copies share no history: the conflicts differ between them, and nothing will be deleted. ")
+        if plan.removed: intro += "Their copy deleted the waymarks listed last; they go if you merge. "
+
+        def merge_confirmed(ev):
+            dlg.open = False
+            self.apply_merge(plan, [i for i, switch in enumerate(switches) if switch.value])
+        dlg = ft.AlertDialog(
+            title=ft.Text(f"{len(plan.conflicts)} conflict(s), {len(plan.removed)} deletion(s)"),
+            content=ft.Container(width=560, height=400, content=ft.Column([
+                ft.Text(f"{intro}{others} other change(s) merge on their own.", size=12),
+                ft.ListView(rows, spacing=10, expand=True),
+            ])),
+            actions=[ft.TextButton("Cancel", on_click=lambda _: setattr(dlg, 'open', False) or self.page.update()),
+                     ft.TextButton("Merge", on_click=merge_confirmed)])
+        self.page.overlay.append(dlg); dlg.open = True; self.page.update()
+
+    def apply_merge(self, plan, theirs=()):
+        try:
+            with self.world_lock:
+                added, changed, removed = plan.apply(self.images, theirs)
+                for entry in removed: self.pending_images.pop(entry.id, None)
+                rows = self.world.search(self.ui_search.value or "")
+        except (OSError, ValueError, sqlite3.Error) as err:
+            self.sync_registry_from_file() # Whatever got written before the failure is shown as it is on disk
+            self.show_message(f"Couldn't merge: {err}")
+            return
+        self.push_to_minimap(added, changed, removed)
+        for entry in [*changed, *removed]: self.card_index.pop(entry.id, None)
+        self.show_rows(rows)
+        self.refresh_world_picker()
+        kept = len(plan.conflicts) - len(set(theirs))
+        self.show_message(f"Merged: {len(added)} added, {len(changed)} changed, {len(removed)} removed"
+                          + (f", kept your version of {kept}" if kept else ""))
+
     # --- SYSTEM HANDLERS ---
-    def save_registry_to_file(self):
-        with open(os.path.join(STORAGE_DIR, f"{self.current_world}.json"), "w") as f:
-            json.dump(self.all_data, f, indent=4)
+    def backfill_card_thumbnails(self):
+        """Background pass that thumbnails older screenshots, then swaps them into the visible cards."""
+        if backfill_thumbnails():
+            self.card_index.clear()
+            self.render_window()
+            self.page.update()
+
+    def collect_unused_images(self):
+        """Low-priority loop that sweeps screenshots no waymark uses any more and reports the space it freed."""
+        time.sleep(IMAGE_GC_DELAY)
+        while True:
+            try:
+                removed, reclaimed = self.images.collect()
+            except (OSError, sqlite3.Error):
+                removed = 0 # Try again next sweep
+            if removed:
+                self.show_message(f"Cleaned up {removed} unused screenshot(s), freeing {reclaimed / 1048576:.1f} MB")
+            time.sleep(IMAGE_GC_INTERVAL)
+
+    def show_message(self, text):
+        snack = ft.SnackBar(ft.Text(text))
+        self.page.overlay.append(snack); snack.open = True; self.page.update()
+
+    def show_input_error(self, fields, err):
+        """Flags the offending field and clears stale errors from the others."""
+        for name, field in fields.items(): field.error_text = str(err) if name == err.field else None
+        self.page.update()
 
     def animate_input_card_color(self, e):
         self.ui_input_card.bgcolor = self.COLOR_OVERWORLD if self.ui_dim_toggle.value == "overworld" else self.COLOR_NETHER
@@ -301,18 +736,17 @@ class WaymarkApp:
 
     def reset_form(self, e):
         self.ui_desc_in.value = self.ui_x_in.value = self.ui_y_in.value = self.ui_z_in.value = ""
+        self.ui_desc_in.error_text = self.ui_x_in.error_text = self.ui_y_in.error_text = self.ui_z_in.error_text = None
         self.selected_image_path = None
         self.ui_img_prev.visible = False
         self.page.update()
 
     def toggle_seed_security(self, e):
+        self.world_ready.wait()
         self.ui_seed_field.read_only = not self.ui_seed_field.read_only
         self.ui_seed_lock.icon = ft.Icons.CHECK if not self.ui_seed_field.read_only else ft.Icons.LOCK_OUTLINE
         if self.ui_seed_field.read_only:
-            meta = next((i for i in self.all_data if i.get("type") == "world_meta"), None)
-            if meta: meta["seed"] = self.ui_seed_field.value
-            else: self.all_data.append({"type": "world_meta", "seed": self.ui_seed_field.value})
-            self.save_registry_to_file()
+            with self.world_lock: self.world.set_seed(self.ui_seed_field.value)
         self.page.update()
 
     def show_new_world_field(self, e):
@@ -322,13 +756,12 @@ class WaymarkApp:
     def execute_world_creation(self, e):
         name = self.ui_new_world_field.value.strip().replace(" ", "_")
         if name:
-            with open(os.path.join(STORAGE_DIR, f"{name}.json"), "w") as f: json.dump([], f)
+            self.store.create_world(name)
             self.ui_new_world_field.value = ""; self.ui_new_world_field.visible = False
             self.init_world_data()
 
     def on_world_swap(self, e):
-        self.current_world = self.ui_world_drop.value
-        self.sync_registry_from_file()
+        self.open_world(self.ui_world_drop.value)
 
     def handle_file_picker_result(self, e):
         if e.files:
@@ -340,20 +773,107 @@ class WaymarkApp:
     def handle_edit_picker_result(self, e):
         if e.files: self.edit_image_path = e.files[0].path
 
+    def handle_import_picker_result(self, e):
+        """Adds the waypoints of each picked minimap file to the open world, one batched write per file."""
+        if not e.files: return
+        self.world_ready.wait()
+        added = skipped = 0
+        for f in e.files:
+            try:
+                entries, seed, bad = read_waypoint_file(f.path)
+            except (OSError, ValueError):
+                skipped += 1; continue
+            with self.world_lock:
+                if entries: self.world.add_many(entries)
+                if seed and not self.world.seed:
+                    self.world.set_seed(seed); self.ui_seed_field.value = seed
+            if entries: self.push_to_minimap(added=entries)
+            added += len(entries); skipped += bad
+        with self.world_lock: rows = self.world.search(self.ui_search.value or "")
+        self.show_rows(rows)
+        self.refresh_world_picker()
+        self.show_message(f"Imported {added} waypoint(s)" + (f", skipped {skipped}" if skipped else ""))
+
+    def handle_export_picker_result(self, e):
+        """Writes the registry's current rows, so a search or Near filter exports just part of the world."""
+        if not e.path: return
+        self.world_ready.wait() # Until then the rows are only the first paint's window
+        path, ext = e.path, os.path.splitext(e.path)[1].lower()
+        if ext not in EXPORT_EXTENSIONS: path, ext = path + ".csv", ".csv"
+        try:
+            count = export_waymarks(list(self.registry_rows), EXPORT_EXTENSIONS[ext], path, self.world.seed)
+            message = f"Exported {count} waymark(s) to {os.path.basename(path)}"
+        except OSError as err:
+            message = f"Export failed: {err}"
+        self.show_message(message)
+
+    def handle_share_picker_result(self, e):
+        """Packs the open world, screenshots included, into one bundle file."""
+        if not e.path: return
+        self.world_ready.wait()
+        path = e.path if e.path.lower().endswith(BUNDLE_EXTENSION) else e.path + BUNDLE_EXTENSION
+        try:
+            count = export_bundle(self.store, self.world.name, path)
+            message = f"Packed {count} waymark(s) into {os.path.basename(path)}"
+        except OSError as err:
+            message = f"Sharing failed: {err}"
+        self.show_message(message)
+
+    def handle_bundle_picker_result(self, e):
+        """Adds a shared bundle as a new world and switches to it."""
+        if not e.files: return
+        self.world_ready.wait()
+        try:
+            name, count = import_bundle(self.store, e.files[0].path, self.images)
+        except (OSError, ValueError, sqlite3.Error) as err:
+            self.show_message(f"Couldn't open bundle: {err}")
+            return
+        self.refresh_world_picker()
+        self.ui_world_drop.value = name
+        self.open_world(name)
+        self.show_message(f"Opened {name} with {count} waymark(s)")
+
     def show_delete_world_dialog(self, e):
         def delete_confirmed(ev):
-            path = os.path.join(STORAGE_DIR, f"{self.current_world}.json")
-            if os.path.exists(path): os.remove(path)
+            self.world_ready.wait()
+            with self.world_lock:
+                for entry in self.world.entries: self.pending_images.pop(entry.id, None)
+                self.images.release(*(entry.image for entry in self.world.entries))
+                self.store.delete_world(self.world.name)
+                unlink_world(self.world.name)
+                forget_base(self.world.name)
+                self.world = None # Nothing left to park
             dlg.open = False; self.init_world_data()
         dlg = ft.AlertDialog(title=ft.Text("Wipe World Data?"), actions=[ft.TextButton("Back", on_click=lambda _: setattr(dlg, 'open', False) or self.page.update()), ft.TextButton("Delete Everything", on_click=delete_confirmed, style=ft.ButtonStyle(color="red"))])
         self.page.overlay.append(dlg); dlg.open = True; self.page.update()
 
     def apply_search_filter(self, e):
-        term = self.ui_search.value.lower()
-        self.ui_registry.controls.clear()
-        for log in self.all_data:
-            if log.get("type") != "world_meta" and term in log['desc'].lower():
-                self.ui_registry.controls.append(self.build_waymark_card(log))
+        """Schedules a debounced query for the current term, cancelling the one still in flight."""
+        if self.search_future: self.search_future.cancel()
+        self.search_future = self.page.run_task(self.run_search, self.ui_search.value or "")
+
+    async def run_search(self, term):
+        await asyncio.sleep(SEARCH_DEBOUNCE)
+        # Nothing below awaits, so a superseded query can only be cancelled during the wait above
+        with self.world_lock: rows = self.world.search(term)
+        self.show_rows(rows)
+        self.page.update()
+        self.remember_session()
+
+    def apply_near_filter(self, e):
+        """Lists waymarks in the selected dimension by distance from the sidebar X/Z."""
+        self.world_ready.wait()
+        fields = {"x": self.ui_x_in, "z": self.ui_z_in, "radius": self.ui_radius_in}
+        try:
+            x, z = parse_coordinate(self.ui_x_in.value, "x"), parse_coordinate(self.ui_z_in.value, "z")
+            radius = parse_radius(self.ui_radius_in.value)
+        except InvalidWaymark as err:
+            return self.show_input_error(fields, err)
+        for field in fields.values(): field.error_text = None
+        dim = self.ui_dim_toggle.value
+        self.ui_search.value = ""
+        with self.world_lock: rows = [entry for _, entry in self.world.near(dim, x, z, radius)]
+        self.show_rows(rows)
         self.page.update()
 
     def preview_image(self, path):
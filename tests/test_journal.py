@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+
+from waymark_core import JournalWorldStore, Waymark, World
+
+class JournalReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.addCleanup(self.tmp.cleanup)
+
+    def store(self):
+        # Thresholds high enough that no background compaction runs behind a test
+        return JournalWorldStore(self.dir, compact_records=10**6, compact_bytes=10**9)
+
+    def descs(self, store=None):
+        return [e.desc for e in (store or self.store()).load_world("W")[0]]
+
+    def test_replays_adds_edits_deletes_and_seed(self):
+        world = World.load(self.store(), "W")
+        a, b = Waymark("a", 1.0, 2.0, 3.0), Waymark("b", 4.0, 5.0, 6.0)
+        world.add(a); world.add(b)
+        a.desc = "a2"; world.update(a)
+        world.remove(b.id)
+        world.set_seed("42")
+        entries, seed = self.store().load_world("W")
+        self.assertEqual([e.desc for e in entries], ["a2"])
+        self.assertEqual(seed, "42")
+
+    def test_torn_tail_is_dropped(self):
+        world = World.load(self.store(), "W")
+        world.add(Waymark("one", 0.0, 0.0, 0.0))
+        with open(os.path.join(self.dir, "W.journal"), "a") as f: f.write('{"op":"add","entry":{"desc":"tw')
+        self.assertEqual(self.descs(), ["one"])
+
+    def test_unterminated_last_record_is_dropped_not_merged(self):
+        world = World.load(self.store(), "W")
+        world.add(Waymark("one", 0.0, 0.0, 0.0))
+        path = os.path.join(self.dir, "W.journal")
+        with open(path, "rb") as f: data = f.read()
+        with open(path, "wb") as f: f.write(data.rstrip(b"\n"))
+        world = World.load(self.store(), "W")
+        self.assertEqual([e.desc for e in world.entries], [])
+        world.add(Waymark("two", 0.0, 0.0, 0.0)); world.add(Waymark("three", 0.0, 0.0, 0.0))
+        self.assertEqual(self.descs(), ["three", "two"])
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        store = self.store()
+        world = World.load(store, "W")
+        world.add_many([Waymark(f"w{i}", float(i), 0.0, 0.0) for i in range(5)])
+        store.compacting.add("W"); store.compact("W")
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "W.journal.old")))
+        with open(os.path.join(self.dir, "W.json")) as f: self.assertEqual(len(json.load(f)), 6) # Five records plus world_meta
+        self.assertEqual(self.descs(), [f"w{i}" for i in reversed(range(5))])
+
+    def test_compaction_interrupted_before_snapshot(self):
+        store = self.store()
+        world = World.load(store, "W")
+        world.add(Waymark("before", 0.0, 0.0, 0.0))
+        # What compact() has done by the time it starts writing the snapshot
+        os.replace(os.path.join(self.dir, "W.journal"), os.path.join(self.dir, "W.journal.old"))
+        store.open_journal("W", 1)
+        store.worlds["W"]["generation"] = 1
+        world.add(Waymark("after", 0.0, 0.0, 0.0))
+        self.assertEqual(self.descs(), ["after", "before"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "W.journal.old")))
+        self.assertEqual(self.descs(), ["after", "before"]) # Folded once, not replayed twice
+
+    def test_compaction_interrupted_after_snapshot(self):
+        store = self.store()
+        world = World.load(store, "W")
+        world.add(Waymark("before", 0.0, 0.0, 0.0))
+        # The snapshot is written but the old segment wasn't removed yet
+        os.replace(os.path.join(self.dir, "W.journal"), os.path.join(self.dir, "W.journal.old"))
+        store.open_journal("W", 1)
+        store.write_snapshot("W", [e.to_dict() for e in world.entries], "", 1)
+        self.assertEqual(self.descs(), ["before"])
+
+    def test_legacy_snapshot_gets_ids(self):
+        with open(os.path.join(self.dir, "W.json"), "w") as f:
+            json.dump([{"desc": "old", "x": "1", "y": "2", "z": "3", "created": "01/02 03:04"}, {"type": "world_meta", "seed": "7"}], f)
+        first = self.store().load_world("W")[0][0]
+        self.assertEqual(self.store().load_world("W")[0][0].id, first.id)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import waymark_core as core
+from waymark_bundle import export_bundle, import_bundle
+from waymark_core import ImageStore, SqliteWorldStore, Waymark, World
+from waymark_merge import MergePlan, plan_merge
+
+def record(desc, id="w1", modified=None):
+    when = datetime(2026, 1, 1)
+    return Waymark(desc, 1.0, 64.0, 2.0, created=when, modified=modified or when, id=id)
+
+class ClassifyTest(unittest.TestCase):
+    def classify(self, base, ours, theirs):
+        plan = MergePlan(None, None)
+        plan.classify(base, ours, theirs)
+        return plan
+
+    def test_unchanged_or_only_ours_changed(self):
+        self.assertEqual(len(self.classify(record("a"), record("a"), record("a"))), 0)
+        self.assertEqual(len(self.classify(record("a"), record("mine"), record("a"))), 0)
+        self.assertEqual(len(self.classify(record("a"), None, record("a"))), 0) # We deleted it
+        self.assertEqual(len(self.classify(None, record("same"), record("same"))), 0)
+
+    def test_their_changes(self):
+        self.assertEqual(self.classify(None, None, record("new")).added[0].desc, "new")
+        self.assertEqual(self.classify(record("a"), record("a"), None).removed[0].desc, "a")
+        ours, theirs = self.classify(record("a"), record("a"), record("b")).changed[0]
+        self.assertEqual((ours.desc, theirs.desc), ("a", "b"))
+
+    def test_conflicts(self):
+        self.assertEqual(len(self.classify(record("a"), record("mine"), record("theirs")).conflicts), 1)
+        self.assertEqual(len(self.classify(record("a"), record("mine"), None).conflicts), 1)
+        self.assertEqual(len(self.classify(None, record("mine"), record("theirs")).conflicts), 1)
+
+    def test_newer(self):
+        old, new = datetime(2026, 1, 1), datetime(2026, 2, 1)
+        self.assertTrue(MergePlan.newer((record("a", modified=old), record("b", modified=new))))
+        self.assertFalse(MergePlan.newer((record("a", modified=new), record("b", modified=old))))
+        self.assertFalse(MergePlan.newer((record("a"), None)))
+        self.assertTrue(MergePlan.newer((None, record("b"))))
+
+class PlanMergeTest(unittest.TestCase):
+    """Two machines, each with its own data folder, passing bundles back and forth."""
+    def setUp(self):
+        self.dirs = {}
+        for side in ("mine", "friend"):
+            tmp = tempfile.TemporaryDirectory()
+            self.addCleanup(tmp.cleanup)
+            self.dirs[side] = tmp.name
+        self.stores = {side: SqliteWorldStore(os.path.join(d, "waymark.db")) for side, d in self.dirs.items()}
+        for store in self.stores.values(): self.addCleanup(store.close)
+        self.world("mine").add_many([Waymark("keep", 0.0, 0.0, 0.0), Waymark("gone", 1.0, 0.0, 0.0)])
+
+    def on(self, side):
+        """Points the merge bases at one machine's data folder."""
+        return mock.patch.object(core, "STORAGE_DIR", self.dirs[side])
+
+    def world(self, side, name="W"):
+        self.stores[side].create_world(name)
+        return World.load(self.stores[side], name)
+
+    def share(self, side, name="W"):
+        path = os.path.join(self.dirs[side], f"{name}-{datetime.now().timestamp()}.waymark")
+        with self.on(side): export_bundle(self.stores[side], name, path)
+        return path
+
+    def unbundle(self, side, path, name=None):
+        with self.on(side): return import_bundle(self.stores[side], path, ImageStore(self.stores[side], self.dirs[side]), name)
+
+    def plan(self, side, path, name="W"):
+        with self.on(side): return plan_merge(self.world(side, name), path)
+
+    def test_with_shared_base(self):
+        self.unbundle("friend", self.share("mine"))
+        friend = self.world("friend")
+        friend.remove(next(e.id for e in friend.entries if e.desc == "gone"))
+        friend.add(Waymark("theirs", 2.0, 0.0, 0.0))
+        plan = self.plan("mine", self.share("friend"))
+        self.assertIsNotNone(plan.base)
+        self.assertEqual([e.desc for e in plan.added], ["theirs"])
+        self.assertEqual([e.desc for e in plan.removed], ["gone"])
+        with self.on("mine"): plan.apply(ImageStore(self.stores["mine"], self.dirs["mine"]))
+        self.assertEqual(sorted(e.desc for e in self.world("mine").entries), ["keep", "theirs"])
+        self.assertEqual(len(self.plan("mine", self.share("friend"))), 0)
+
+    def test_copy_of_an_older_snapshot_keeps_later_additions(self):
+        first = self.share("mine")
+        self.world("mine").add(Waymark("added after sharing", 3.0, 0.0, 0.0))
+        self.share("mine") # A later export must not become the base for copies of the first one
+        self.unbundle("friend", first)
+        self.world("friend").add(Waymark("theirs", 2.0, 0.0, 0.0))
+        plan = self.plan("mine", self.share("friend"))
+        self.assertIsNotNone(plan.base)
+        self.assertEqual([e.desc for e in plan.added], ["theirs"])
+        self.assertEqual(plan.removed, [])
+
+    def test_without_shared_base_deletes_nothing(self):
+        other = self.world("friend", "Other")
+        other.add_many([Waymark("keep", 0.0, 0.0, 0.0), Waymark("new", 5.0, 0.0, 0.0)])
+        plan = self.plan("mine", self.share("friend", "Other"))
+        self.assertIsNone(plan.base)
+        self.assertEqual([e.desc for e in plan.added], ["new"]) # "keep" is already here under another ID
+        self.assertEqual((plan.removed, plan.conflicts), ([], []))
+
+    def test_ids_held_by_another_world_are_reassigned(self):
+        self.world("mine", "Other")
+        plan = self.plan("mine", self.share("mine"), "Other")
+        self.assertEqual(len(plan.added), 2)
+        with self.on("mine"): plan.apply(ImageStore(self.stores["mine"], self.dirs["mine"]))
+        ids = [e.id for name in ("W", "Other") for e in self.world("mine", name).entries]
+        self.assertEqual(len(set(ids)), 4)
+
+if __name__ == "__main__":
+    unittest.main()
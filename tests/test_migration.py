@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from waymark_core import SqliteWorldStore
+
+def legacy(desc, id=None):
+    item = {"desc": desc, "x": "1", "y": "64", "z": "-3", "dimension": "overworld", "created": "01/02 03:04", "image": ""}
+    if id: item["id"] = id
+    return item
+
+class JsonMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, data):
+        with open(os.path.join(self.dir, name), "w") as f: json.dump(data, f)
+
+    def open(self):
+        store = SqliteWorldStore(os.path.join(self.dir, "waymark.db"))
+        self.addCleanup(store.close)
+        return store
+
+    def files(self):
+        return sorted(f for f in os.listdir(self.dir) if not f.startswith("waymark.db"))
+
+    def counts(self, store):
+        return {w["name"]: w["entries"] for w in store.catalog()}
+
+    def test_imports_worlds_and_renames_files(self):
+        self.write("A.json", [legacy("newer"), legacy("older"), {"type": "world_meta", "seed": "123"}])
+        store = self.open()
+        entries, seed = store.load_world("A")
+        self.assertEqual([e.desc for e in entries], ["newer", "older"])
+        self.assertEqual((entries[0].x, entries[0].y, entries[0].z, seed), (1.0, 64.0, -3.0, "123"))
+        self.assertEqual(self.files(), ["A.json.migrated"])
+
+    def test_skips_malformed_items(self):
+        self.write("B.json", [None, 5, "text", legacy("kept"), legacy("bad") | {"created": 7}])
+        self.write("C.json", {"not": "a list"})
+        self.assertEqual(self.counts(self.open()), {"B": 1, "C": 0})
+
+    def test_duplicate_ids_get_fresh_ones(self):
+        self.write("A.json", [legacy("a", "same")])
+        self.write("B.json", [legacy("b", "same"), legacy("b2", "same")])
+        store = self.open()
+        self.assertEqual(self.counts(store), {"A": 1, "B": 2})
+        ids = [e.id for w in ("A", "B") for e in store.load_world(w)[0]]
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_failed_migration_runs_again_in_full(self):
+        for name in "ABC": self.write(f"{name}.json", [legacy(f"{name}{i}") for i in range(2)])
+        calls = []
+        def crash(store, *args):
+            calls.append(1)
+            if len(calls) == 4: raise RuntimeError("crash")
+            return write_entry(store, *args)
+        write_entry = SqliteWorldStore.write_entry
+        with mock.patch.object(SqliteWorldStore, "write_entry", crash), self.assertRaises(RuntimeError):
+            SqliteWorldStore(os.path.join(self.dir, "waymark.db"))
+        self.assertIn("A.json", self.files())
+        self.assertEqual(self.counts(self.open()), {"A": 2, "B": 2, "C": 2})
+
+    def test_leaves_journal_engine_worlds_alone(self):
+        self.write("J.json", [legacy("journal", "j1"), {"type": "world_meta", "seed": "", "generation": 0}])
+        with open(os.path.join(self.dir, "J.journal"), "w") as f: f.write('{"op":"open","generation":0}\n')
+        self.write("K.json", [{"type": "world_meta", "seed": "", "generation": 0}])
+        self.assertEqual(self.counts(self.open()), {})
+        self.assertEqual(self.files(), ["J.journal", "J.json", "K.json"])
+
+if __name__ == "__main__":
+    unittest.main()